@@ -0,0 +1,337 @@
+import asyncio
+import hashlib
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import discord
+
+from cogs.spotify import SpotifyClient
+
+# Local stand-ins for Discord, the Spotify Web API and yt-dlp. They implement just enough
+# of each interface for the Music cog to run its real code paths without any network.
+
+
+def _video_id(query):
+    return hashlib.sha1(query.encode('utf-8')).hexdigest()[:11]
+
+
+def spotify_track(index, duration_ms=None):
+    return {
+        'id': f'sp{index:08d}',
+        'name': f'Track {index}',
+        'duration_ms': duration_ms or 180000 + index % 60 * 1000,
+        'artists': [{'name': f'Artist {index % 500}'}],
+        'album': {'images': [{'url': f'https://i.scdn.co/image/{index}'}]},
+    }
+
+
+class FakeSpotify(SpotifyClient):
+    """
+    SpotifyClient answering from generated data instead of the Web API, so its paging logic
+    still runs. Every request waits `latency` seconds, like a round trip would.
+    """
+
+    def __init__(self, latency=0.05, playlist_size=1000, duration_ms=None):
+        super().__init__(client_id=None, client_secret=None)
+        self.latency = latency
+        self.playlist_size = playlist_size
+        self.duration_ms = duration_ms  # Length of every track, varied by default
+        self.calls = 0
+
+    async def _get(self, url, params=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        parsed = urlparse(url)
+        params = {**{k: v[0] for k, v in parse_qs(parsed.query).items()}, **(params or {})}
+        path = parsed.path.removeprefix('/v1/').strip('/').split('/')
+        if path[0] == 'tracks' and len(path) == 2:
+            return self._track(self._index(path[1]))
+        if path[0] == 'search':
+            index = self._index(params['q'])
+            return {'tracks': {'items': [self._track(index + i) for i in range(int(params['limit']))]}}
+        if path[0] == 'playlists':
+            return self._page(path[1], int(params.get('offset', 0)), int(params.get('limit', 100)))
+        if path[0] == 'albums' and len(path) == 2:
+            return {'images': [{'url': 'https://i.scdn.co/image/album'}], 'tracks': self._page(path[1], 0, 50, album=True)}
+        if path[0] == 'albums':
+            return self._page(path[1], int(params.get('offset', 0)), int(params.get('limit', 50)), album=True)
+        if path[0] == 'artists':
+            return {'tracks': [self._track(self._index(path[1]) + i) for i in range(10)]}
+        raise ValueError(f"FakeSpotify has no route for {url}")
+
+    def _track(self, index):
+        return spotify_track(index, self.duration_ms)
+
+    def _index(self, key):
+        if key.startswith('sp') and key[2:].isdigit():
+            return int(key[2:])
+        return int(_video_id(key), 16) % 10 ** 8
+
+    def _page(self, collection_id, offset, limit, album=False):
+        # Each collection gets its own range of track IDs so guilds don't share cache entries
+        base = int(_video_id(collection_id), 16) % 10 ** 6 * 10 ** 2
+        end = min(offset + limit, self.playlist_size)
+        kind = 'albums' if album else 'playlists'
+        next_url = f"{self.api_url}/{kind}/{collection_id}/tracks?offset={end}&limit={limit}" if end < self.playlist_size else None
+        if album:
+            items = [{k: v for k, v in self._track(base + i).items() if k != 'album'} for i in range(offset, end)]
+        else:
+            items = [{'track': self._track(base + i)} for i in range(offset, end)]
+        return {'items': items, 'next': next_url, 'total': self.playlist_size}
+
+
+class FakeYoutubeDL:
+    """Replaces YoutubeDL.extract_info. Blocks its resolver thread for `latency` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def extract_info(self, query, download=False):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        search = query.startswith('ytsearch:')
+        video_id = _video_id(query[len('ytsearch:'):] if search else query)
+        stream = f'https://rr1.googlevideo.com/videoplayback?id={video_id}&expire={int(time.time()) + 21600}'
+        info = {
+            'id': video_id,
+            'title': query,
+            'url': f'{stream}&itag=251',
+            'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+            'thumbnail': None,
+            'duration': 180,
+            'acodec': 'opus',
+            'formats': [
+                {'format_id': itag, 'url': f'{stream}&itag={itag}', 'vcodec': 'none', 'acodec': acodec, 'abr': abr}
+                for itag, acodec, abr in (('249', 'opus', 50), ('250', 'opus', 70), ('140', 'mp4a.40.2', 129), ('251', 'opus', 135))
+            ],
+        }
+        return {'entries': [info]} if search else info
+
+
+class FakeYoutubeDLPool:
+    """Replaces YoutubeDLPool."""
+
+    def __init__(self, latency=0.2):
+        self.ydl = FakeYoutubeDL(latency)
+
+    def get(self):
+        return self.ydl
+
+    def recycle(self):
+        pass
+
+    def warm_up(self, executor, workers):
+        pass
+
+
+class SilentSource(discord.AudioSource):
+    """
+    Stands in for the ffmpeg sources, which need ffmpeg and a reachable stream. The first read
+    blocks for `startup` seconds, like ffmpeg connecting to the stream and decoding its start.
+    """
+
+    def __init__(self, startup=0):
+        self.startup = startup
+
+    def read(self):
+        if self.startup:
+            time.sleep(self.startup)
+            self.startup = 0
+        return b'\x00' * 3840
+
+    def cleanup(self):
+        pass
+
+
+class FakeVoiceClient:
+    """
+    Reads a source's first packet on a thread, as the audio player would, then plays it for
+    `track_seconds` of wall time and calls `after`. With track_seconds=None tracks only end
+    when skipped or stopped.
+    """
+
+    def __init__(self, channel, track_seconds=None):
+        self.channel = channel
+        self.track_seconds = track_seconds
+        self.source = None
+        self._after = None
+        self._end = None
+        self._paused = False
+        self.plays = []  # perf_counter() of every first packet
+        self.ends = []  # perf_counter() of every track end
+
+    def play(self, source, *, after=None):
+        if self.source is not None:
+            raise discord.ClientException('Already playing audio.')
+        self.source = source
+        self._after = after
+        self._paused = False
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._first_packet, args=(source, loop), daemon=True).start()
+
+    def _first_packet(self, source, loop):
+        source.read()
+        loop.call_soon_threadsafe(self._started, source)
+
+    def _started(self, source):
+        if self.source is not source:
+            return  # Stopped before it got going
+        self.plays.append(time.perf_counter())
+        if self.track_seconds is not None:
+            self._end = asyncio.get_running_loop().call_later(self.track_seconds, self._finish)
+
+    def _finish(self):
+        if self.source is None:
+            return
+        if self._end is not None:
+            self._end.cancel()
+            self._end = None
+        self.source.cleanup()
+        self.source = None
+        after, self._after = self._after, None
+        self.ends.append(time.perf_counter())
+        if after:
+            after(None)
+
+    def is_playing(self):
+        return self.source is not None and not self._paused
+
+    def is_paused(self):
+        return self.source is not None and self._paused
+
+    def is_connected(self):
+        return True
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        self._finish()
+
+    async def disconnect(self, force=False):
+        self._finish()
+        self.channel.guild.voice_client = None
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None, view=None):
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+    async def edit(self, **fields):
+        self.channel.edits += 1
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    async def delete(self):
+        pass
+
+
+class FakeTextChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.sent = 0
+        self.edits = 0
+
+    async def send(self, content=None, *, embed=None, view=None):
+        self.sent += 1
+        return FakeMessage(self, content, embed, view)
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, channel_id, track_seconds=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = f'voice-{channel_id}'
+        self.bitrate = 64000
+        self.track_seconds = track_seconds
+
+    async def connect(self, **kwargs):
+        self.guild.voice_client = FakeVoiceClient(self, self.track_seconds)
+        return self.guild.voice_client
+
+
+class FakeMember:
+    def __init__(self, member_id, voice_channel=None):
+        self.id = member_id
+        self.display_name = f'user-{member_id}'
+        self.display_avatar = type('Asset', (), {'url': 'https://cdn.discordapp.com/embed/avatars/0.png'})()
+        self.voice = type('VoiceState', (), {'channel': voice_channel})() if voice_channel else None
+
+
+class FakeGuild:
+    def __init__(self, guild_id, track_seconds=None):
+        self.id = guild_id
+        self.voice_client = None
+        self.text_channel = FakeTextChannel(guild_id * 10 + 1)
+        self.voice_channel = FakeVoiceChannel(self, guild_id * 10 + 2, track_seconds)
+        self.member = FakeMember(guild_id * 10 + 3, self.voice_channel)
+
+    def get_channel(self, channel_id):
+        return {self.text_channel.id: self.text_channel, self.voice_channel.id: self.voice_channel}.get(channel_id)
+
+    def get_channel_or_thread(self, channel_id):
+        return self.get_channel(channel_id)
+
+    def get_member(self, member_id):
+        return self.member if member_id == self.member.id else None
+
+
+class FakeContext:
+    def __init__(self, guild):
+        self.guild = guild
+        self.channel = guild.text_channel
+        self.author = guild.member
+        self.command = None
+        self.interaction = None  # Prefix command invocation
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeInteraction:
+    """What autocomplete callbacks read off an interaction."""
+
+    def __init__(self, guild):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = guild.member
+
+
+class FakeBot:
+    """The parts of commands.Bot the Music cog touches."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.guilds = {}
+        self.cogs = {}
+
+    def is_ready(self):
+        return True
+
+    @property
+    def voice_clients(self):
+        return [guild.voice_client for guild in self.guilds.values() if guild.voice_client]
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
+
+    def add_guild(self, guild):
+        self.guilds[guild.id] = guild
+        return guild
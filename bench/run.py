@@ -0,0 +1,423 @@
+"""
+Offline benchmark for the Music cog.
+
+Drives the real command handlers, handle_playlist and play_next against the stand-ins in
+bench/fakes.py and prints one JSON document with the results and the commit they were taken on.
+Run from the repository root:
+
+    python -m bench.run --guilds 50 --tracks 1000 --output bench_output.txt
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Keep the benchmark away from the real data directory and any local services.
+# These are read at import time, so they have to be set before the cogs are imported.
+_DATA_DIR = tempfile.mkdtemp(prefix='spotibot-bench-')
+os.environ['RESOLUTION_CACHE_PATH'] = os.path.join(_DATA_DIR, 'resolution_cache.sqlite3')
+os.environ['AUDIO_CACHE_DIR'] = os.path.join(_DATA_DIR, 'audio')
+os.environ['AUDIO_CACHE_MAX_BYTES'] = '0'
+os.environ['SNAPSHOT_PATH'] = os.path.join(_DATA_DIR, 'queues.json.gz')
+os.environ['METRICS_PORT'] = '0'
+os.environ['YTDL_WARMUP'] = '0'
+# Sources are silent stand-ins without an ffmpeg process, don't cap them
+os.environ['FFMPEG_MAX_STREAMS'] = '1000000'
+
+from bench.fakes import FakeBot, FakeContext, FakeGuild, FakeInteraction, FakeSpotify, FakeYoutubeDLPool, SilentSource  # noqa: E402
+from cogs import music  # noqa: E402
+from cogs.cache import ResolutionCache  # noqa: E402
+from cogs.ytdl import YoutubeDLPool  # noqa: E402
+
+LAG_INTERVAL = 0.01
+
+# Imports the cog in a fresh interpreter and reports the time it took and what it pulled in
+IMPORT_PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import cogs.music\n"
+    "print(json.dumps({'seconds': time.perf_counter() - started, 'yt_dlp': 'yt_dlp' in sys.modules}))\n"
+)
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def summarize(values, scale=1000):
+    """Count, mean and percentiles of a list of seconds, in milliseconds by default."""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * scale, 3)
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered) * scale, 3),
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'p99': percentile(99),
+        'max': round(ordered[-1] * scale, 3),
+    }
+
+
+class LagMonitor:
+    """Measures how late a LAG_INTERVAL timer fires, the same way MetricsServer samples lag."""
+
+    def __init__(self):
+        self.samples = []
+        self._task = None
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            self.samples.append(max(0.0, time.perf_counter() - expected))
+
+
+class Harness:
+    """A Music cog wired to fakes, with one fake guild per simulated server."""
+
+    def __init__(self, args, name, track_seconds=None):
+        self.args = args
+        self.bot = FakeBot(asyncio.get_running_loop())
+        self.cog = music.Music(self.bot)
+        self.bot.cogs['Music'] = self.cog
+        # A fresh cache per scenario, so earlier scenarios don't turn lookups into hits
+        self.cog.resolution_cache.close()
+        self.cog.resolution_cache = ResolutionCache(os.path.join(_DATA_DIR, f'{name}.sqlite3'))
+        self.cog.sp = FakeSpotify(args.spotify_latency, args.tracks, int(track_seconds * 1000) if track_seconds else None)
+        self.cog.ytdl = FakeYoutubeDLPool(args.ytdl_latency)
+        self.cog._create_source = lambda track, cached_path=None, start=0: SilentSource(args.ffmpeg_startup)
+        self.guilds = [self.bot.add_guild(FakeGuild(1000 + i, track_seconds)) for i in range(args.guilds)]
+        self.latencies = {}
+
+    async def command(self, name, ctx, *args, **kwargs):
+        command = getattr(self.cog, name)
+        started = time.perf_counter()
+        await command.callback(self.cog, ctx, *args, **kwargs)
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+    def queued(self, guild):
+        player = self.cog.get_player(guild.id)
+        return len(player) + (1 if player.current else 0)
+
+    async def wait_for(self, condition, timeout):
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Benchmark scenario timed out")
+            await asyncio.sleep(0.005)
+
+    async def close(self):
+        for player in self.cog.players.values():
+            player.stop()
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.cog.cog_unload()
+
+
+async def playlist_ingest(args, trace_memory=False):
+    """Every guild loads a playlist at once, then runs the queue commands on the full queue."""
+    if trace_memory:
+        tracemalloc.start()
+    harness = Harness(args, 'memory' if trace_memory else 'playlist')
+    contexts = [FakeContext(guild) for guild in harness.guilds]
+    total = args.guilds * args.tracks
+    try:
+        baseline = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+        with LagMonitor() as lag:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                harness.command('play', ctx, query=f'https://open.spotify.com/playlist/bench{ctx.guild.id}')
+                for ctx in contexts
+            ))
+            await harness.wait_for(lambda: all(harness.queued(g) >= args.tracks for g in harness.guilds), args.timeout)
+            ingest_seconds = time.perf_counter() - started
+            if trace_memory:
+                return {'bytes_per_queued_track': round((tracemalloc.get_traced_memory()[0] - baseline) / total, 1)}
+
+            # Playback may start after the whole playlist is queued
+            await harness.wait_for(lambda: all(g.voice_client and g.voice_client.plays for g in harness.guilds), args.timeout)
+            first_audio = [g.voice_client.plays[0] - started for g in harness.guilds]
+            for ctx in contexts:
+                await harness.command('queue', ctx)
+                await harness.command('shuffle', ctx)
+                await harness.command('move', ctx, args.tracks - 1, 1)
+                await harness.command('remove', ctx, args.tracks // 2)
+        return {
+            'tracks': total,
+            'ingest_seconds': round(ingest_seconds, 3),
+            'tracks_per_second': round(total / ingest_seconds, 1),
+            'time_to_first_audio_ms': summarize(first_audio),
+            'command_latency_ms': {name: summarize(values) for name, values in harness.latencies.items()},
+            'loop_lag_ms': summarize(lag.samples),
+        }
+    finally:
+        await harness.close()
+        if trace_memory:
+            tracemalloc.stop()
+
+
+async def search_commands(args):
+    """Every guild issues back to back !play searches that all miss the cache, checking the queue in between."""
+    harness = Harness(args, 'commands')
+
+    async def session(guild):
+        ctx = FakeContext(guild)
+        for i in range(args.commands):
+            await harness.command('play', ctx, query=f'song {guild.id} {i}')
+            await harness.command('queue', ctx)
+        await harness.command('skip', ctx)
+
+    try:
+        with LagMonitor() as lag:
+            started = time.perf_counter()
+            await asyncio.gather(*(session(guild) for guild in harness.guilds))
+            elapsed = time.perf_counter() - started
+        return {
+            'commands': args.guilds * args.commands,
+            'seconds': round(elapsed, 3),
+            'command_latency_ms': {name: summarize(values) for name, values in harness.latencies.items()},
+            'loop_lag_ms': summarize(lag.samples),
+        }
+    finally:
+        await harness.close()
+
+
+async def burst(args):
+    """Every guild asks for the same few songs at the same moment, counting the outbound requests."""
+    harness = Harness(args, 'burst')
+    songs = [f'trending song {i}' for i in range(args.burst_songs)]
+
+    async def session(guild):
+        ctx = FakeContext(guild)
+        for song in songs:
+            await harness.command('play', ctx, query=song)
+
+    try:
+        with LagMonitor() as lag:
+            started = time.perf_counter()
+            await asyncio.gather(*(session(guild) for guild in harness.guilds))
+            elapsed = time.perf_counter() - started
+        return {
+            'requests': args.guilds * len(songs),
+            'spotify_requests': harness.cog.sp.calls,
+            'ytdl_extractions': harness.cog.ytdl.ydl.calls,
+            'seconds': round(elapsed, 3),
+            'command_latency_ms': {name: summarize(values) for name, values in harness.latencies.items()},
+            'loop_lag_ms': summarize(lag.samples),
+        }
+    finally:
+        await harness.close()
+
+
+async def playback(args):
+    """Every guild plays a short playlist of short tracks to the end, measuring the gap between tracks."""
+    playlist_args = argparse.Namespace(**{**vars(args), 'tracks': args.playback_tracks})
+    harness = Harness(playlist_args, 'playback', track_seconds=args.track_seconds)
+    try:
+        with LagMonitor() as lag:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                harness.command('play', FakeContext(guild), query=f'https://open.spotify.com/playlist/play{guild.id}')
+                for guild in harness.guilds
+            ))
+
+            def finished():
+                return all(g.voice_client and len(g.voice_client.ends) >= args.playback_tracks for g in harness.guilds)
+
+            await harness.wait_for(finished, args.timeout + args.playback_tracks * args.track_seconds)
+            elapsed = time.perf_counter() - started
+        gaps = []
+        for guild in harness.guilds:
+            vc = guild.voice_client
+            gaps.extend(start - end for end, start in zip(vc.ends, vc.plays[1:]))
+        return {
+            'tracks': args.guilds * args.playback_tracks,
+            'seconds': round(elapsed, 3),
+            'gap_between_tracks_ms': summarize(gaps),
+            'loop_lag_ms': summarize(lag.samples),
+        }
+    finally:
+        await harness.close()
+
+
+async def autocomplete(args):
+    """
+    Every guild's user types a search into /play one keystroke at a time, picks the first
+    suggestion and submits it a moment later. Picking sends nothing to the bot, like on Discord. The same searches are also submitted as plain text
+    without autocomplete. Compares the time from submitting to the first audio packet and the
+    outbound requests of both.
+    """
+    queries = [f'artist {i} song title' for i in range(args.guilds)]
+
+    async def typed(harness, guild, query):
+        interaction = FakeInteraction(guild)
+        # Like a client, every keystroke sends a request without waiting for the previous answer
+        requests = []
+        for end in range(1, len(query) + 1):
+            requests.append(asyncio.ensure_future(harness.cog.play_autocomplete(interaction, query[:end])))
+            await asyncio.sleep(args.keystroke_seconds)
+        choices = await requests[-1]
+        await asyncio.gather(*requests)
+        await asyncio.sleep(2 * args.think_seconds)  # Reading the suggestions, picking one and pressing enter
+        return choices[0].value
+
+    async def session(harness, guild, query, suggest):
+        if suggest:
+            query = await typed(harness, guild, query)
+        else:
+            # Same typing time, without anything happening meanwhile
+            await asyncio.sleep(len(query) * args.keystroke_seconds + 2 * args.think_seconds)
+        submitted = time.perf_counter()
+        await harness.command('play', FakeContext(guild), query=query)
+        await harness.wait_for(lambda: guild.voice_client and guild.voice_client.plays, args.timeout)
+        return guild.voice_client.plays[0] - submitted
+
+    results = {}
+    for mode, suggest in (('plain', False), ('autocomplete', True)):
+        harness = Harness(args, f'autocomplete-{mode}')
+        try:
+            with LagMonitor() as lag:
+                first_audio = await asyncio.gather(*(
+                    session(harness, guild, query, suggest) for guild, query in zip(harness.guilds, queries)
+                ))
+            results[mode] = {
+                'submit_to_first_audio_ms': summarize(first_audio),
+                'spotify_requests': harness.cog.sp.calls,
+                'ytdl_extractions': harness.cog.ytdl.ydl.calls,
+                'suggestions': harness.cog.suggestions.stats(),
+                'loop_lag_ms': summarize(lag.samples),
+            }
+        finally:
+            await harness.close()
+    return results
+
+
+async def startup(args):
+    """
+    Cold start: importing the cog in fresh interpreters, building it, then warming the resolver
+    with real yt-dlp instances the way on_ready does. yt-dlp never touches the network here.
+    """
+    imports = []
+    for _ in range(args.startup_runs):
+        probe = subprocess.run([sys.executable, '-c', IMPORT_PROBE], capture_output=True, text=True, check=True)
+        imports.append(json.loads(probe.stdout))
+
+    started = time.perf_counter()
+    harness = Harness(args, 'startup')
+    init_seconds = time.perf_counter() - started
+    harness.bot.started_at = time.monotonic() - init_seconds  # The cog's own startup phases count from here
+    harness.cog.ytdl = YoutubeDLPool(music.YDL_OPTIONS)
+    warmup = music.YTDL_WARMUP
+    music.YTDL_WARMUP = True
+    try:
+        with LagMonitor() as lag:
+            started = time.perf_counter()
+            await harness.cog.on_ready()
+            await asyncio.wait_for(harness.cog.ready.wait(), args.timeout)
+            warm_seconds = time.perf_counter() - started
+        import_seconds = min(probe['seconds'] for probe in imports)
+        return {
+            'import_ms': summarize([probe['seconds'] for probe in imports]),
+            'yt_dlp_imported_with_cog': any(probe['yt_dlp'] for probe in imports),
+            'cog_init_ms': round(init_seconds * 1000, 3),
+            'warm_up_ms': round(warm_seconds * 1000, 3),
+            'budget_seconds': music.STARTUP_BUDGET,
+            'within_budget': import_seconds + init_seconds + warm_seconds <= music.STARTUP_BUDGET,
+            'loop_lag_ms': summarize(lag.samples),
+        }
+    finally:
+        music.YTDL_WARMUP = warmup
+        await harness.close()
+
+
+SCENARIOS = ('playlist', 'memory', 'commands', 'burst', 'playback', 'autocomplete', 'startup')
+
+
+async def run(args):
+    results = {}
+    for scenario in args.scenarios:
+        print(f"Running {scenario}...", file=sys.stderr)
+        if scenario == 'playlist':
+            results[scenario] = await playlist_ingest(args)
+        elif scenario == 'memory':
+            results[scenario] = await playlist_ingest(args, trace_memory=True)
+        elif scenario == 'commands':
+            results[scenario] = await search_commands(args)
+        elif scenario == 'burst':
+            results[scenario] = await burst(args)
+        elif scenario == 'playback':
+            results[scenario] = await playback(args)
+        elif scenario == 'autocomplete':
+            results[scenario] = await autocomplete(args)
+        elif scenario == 'startup':
+            results[scenario] = await startup(args)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the Music cog")
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--tracks', type=int, default=1000, help="Playlist length per guild")
+    parser.add_argument('--commands', type=int, default=20, help="!play searches per guild in the commands scenario")
+    parser.add_argument('--burst-songs', type=int, default=5, help="Songs every guild requests at once in the burst scenario")
+    parser.add_argument('--playback-tracks', type=int, default=8, help="Tracks played per guild in the playback scenario")
+    parser.add_argument('--track-seconds', type=int, default=3, help="Simulated track length in the playback scenario")
+    parser.add_argument('--spotify-latency', type=float, default=0.05, help="Seconds per fake Spotify request")
+    parser.add_argument('--ytdl-latency', type=float, default=0.2, help="Seconds per fake yt-dlp extraction")
+    parser.add_argument('--ffmpeg-startup', type=float, default=0.5, help="Seconds from opening a source to its first packet")
+    parser.add_argument('--keystroke-seconds', type=float, default=0.12, help="Time between keystrokes in the autocomplete scenario")
+    parser.add_argument('--think-seconds', type=float, default=0.8, help="Time to pick a suggestion, and again to submit it")
+    parser.add_argument('--startup-runs', type=int, default=3, help="Fresh interpreters importing the cog in the startup scenario")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--output', help="Also write the JSON results to this file")
+    parser.add_argument('scenarios', nargs='*', metavar='scenario', help=f"Any of {', '.join(SCENARIOS)} (default: all)")
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    report = {
+        'commit': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': {name: value for name, value in vars(args).items() if name not in ('output', 'scenarios')},
+        'results': asyncio.run(run(args)),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+
+
+if __name__ == '__main__':
+    main()
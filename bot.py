@@ -1,5 +1,10 @@
+import time
+# Taken before the other imports so startup timing covers them
+PROCESS_STARTED = time.monotonic()
+
 import discord
 from discord.ext import commands
+import multiprocessing
 import os
 from dotenv import load_dotenv
 
@@ -10,17 +15,64 @@ DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 SPOTIPY_CLIENT_ID = os.getenv("SPOTIPY_CLIENT_ID")
 SPOTIPY_CLIENT_SECRET = os.getenv("SPOTIPY_CLIENT_SECRET")
 
-# --- Discord Bot Setup ---
-intents = discord.Intents.default()
-intents.message_content = True  # Enable message content intent
-intents.voice_states = True     # Enable voice state intent for joining/leaving voice channels
-bot = commands.Bot(command_prefix='!', intents=intents)
+# --- Sharding ---
+# Total number of shards; unset lets Discord recommend one (single process only)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+# Worker processes the shards are spread across, each with its own event loop and GIL
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", "1"))
+
+
+class SpotiBot(commands.AutoShardedBot):
+    started_at = PROCESS_STARTED  # monotonic time the process started, the cog measures startup from it
+
+    async def setup_hook(self):
+        started = time.monotonic()
+        try:
+            await self.load_extension("cogs.music")
+        except Exception as e:
+            print(f"Failed to load extension cogs.music: {e}")
+            raise
+        print(f"Loaded cogs.music in {time.monotonic() - started:.2f}s, {time.monotonic() - self.started_at:.2f}s after start")
+
+
+def create_bot(shard_ids=None, shard_count=None):
+    # --- Discord Bot Setup ---
+    intents = discord.Intents.default()
+    intents.message_content = True  # Enable message content intent
+    intents.voice_states = True     # Enable voice state intent for joining/leaving voice channels
+    return SpotiBot(command_prefix='!', intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+
+
+def run_cluster(cluster_id, shard_ids, shard_count):
+    # Each cluster keeps its own queue snapshot; the resolution and audio caches are shared
+    os.environ["SNAPSHOT_PATH"] = os.path.join("data", f"queues-{cluster_id}.json.gz")
+    # One metrics endpoint per cluster, on consecutive ports
+    if os.getenv("METRICS_PORT"):
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + cluster_id)
+    print(f"Cluster {cluster_id} starting shards {shard_ids} of {shard_count}")
+    SpotiBot.started_at = time.monotonic() # Forked from the supervisor, which may have been up for a while
+    create_bot(shard_ids=shard_ids, shard_count=shard_count).run(DISCORD_TOKEN)
+
+
+def run_clusters():
+    """Spreads SHARD_COUNT shards over CLUSTER_COUNT processes and restarts any that exit."""
+    shard_count = SHARD_COUNT or CLUSTER_COUNT
+    clusters = {
+        cluster_id: list(range(cluster_id, shard_count, CLUSTER_COUNT))
+        for cluster_id in range(min(CLUSTER_COUNT, shard_count))
+    }
+    processes = {}
+    while True:
+        for cluster_id, shard_ids in clusters.items():
+            process = processes.get(cluster_id)
+            if process is None or not process.is_alive():
+                if process is not None:
+                    print(f"Cluster {cluster_id} exited with code {process.exitcode}, restarting")
+                process = multiprocessing.Process(target=run_cluster, args=(cluster_id, shard_ids, shard_count), daemon=True)
+                process.start()
+                processes[cluster_id] = process
+        time.sleep(5)
 
-try:
-    bot.load_extension("cogs.music")
-except Exception as e:
-    print(f"Failed to load extension cogs.music: {e}")
-    raise
 
 # Run the bot
 if __name__ == "__main__":
@@ -28,5 +80,7 @@ if __name__ == "__main__":
         print("Error: DISCORD_TOKEN not found in .env file.")
     elif SPOTIPY_CLIENT_ID is None or SPOTIPY_CLIENT_SECRET is None:
         print("Error: SPOTIPY_CLIENT_ID or SPOTIPY_CLIENT_SECRET not found in .env file.")
+    elif CLUSTER_COUNT > 1:
+        run_clusters()
     else:
-        bot.run(DISCORD_TOKEN)
\ No newline at end of file
+        create_bot(shard_count=SHARD_COUNT).run(DISCORD_TOKEN)
@@ -0,0 +1,158 @@
+import asyncio
+import contextlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join("data", "audio"))
+# Total size of cached audio files; 0 disables the cache
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# A track is downloaded once it has been played this many times
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv("AUDIO_CACHE_MIN_PLAYS", "3"))
+AUDIO_CACHE_FILL_CONCURRENCY = int(os.getenv("AUDIO_CACHE_FILL_CONCURRENCY", "1"))
+
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class AudioCache:
+    """
+    Size-bounded on-disk cache of frequently played tracks, keyed by YouTube video ID.
+
+    Files are stored as Ogg/Opus so they can be played with codec copy. Play counts are
+    persisted; a track is fetched in the background once it reaches AUDIO_CACHE_MIN_PLAYS,
+    and the least recently played files (fewest plays first on ties) are evicted when the
+    cache outgrows AUDIO_CACHE_MAX_BYTES.
+
+    The index is shared with other processes and can be locked for seconds, so path_for() and
+    record_play() block: the event loop calls them through an executor. fill() is a coroutine
+    and moves its own blocking work off the loop.
+    """
+
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES, min_plays=AUDIO_CACHE_MIN_PLAYS, track_process=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.track_process = track_process  # Called with every ffmpeg process a fill starts
+        self._filling = set()
+        self._fill_slots = asyncio.Semaphore(AUDIO_CACHE_FILL_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._db = None
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            # Shared by every cluster process, see ResolutionCache
+            self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    video_id TEXT PRIMARY KEY,
+                    plays INTEGER NOT NULL DEFAULT 0,
+                    last_played REAL NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _file_for(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.opus")
+
+    def path_for(self, video_id):
+        """Returns the cached file for a video, or None if it isn't cached."""
+        if not self.enabled or not video_id or not _VIDEO_ID.match(video_id):
+            return None
+        path = self._file_for(video_id)
+        return path if os.path.exists(path) else None
+
+    def record_play(self, video_id):
+        """Counts a play. Returns True if the track should now be downloaded into the cache."""
+        if not self.enabled or not video_id or not _VIDEO_ID.match(video_id):
+            return False
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO tracks (video_id, plays, last_played) VALUES (?, 1, ?) "
+                "ON CONFLICT(video_id) DO UPDATE SET plays = plays + 1, last_played = excluded.last_played",
+                (video_id, time.time()),
+            )
+            self._db.commit()
+            plays = self._db.execute("SELECT plays FROM tracks WHERE video_id = ?", (video_id,)).fetchone()[0]
+        return plays >= self.min_plays and video_id not in self._filling and not self.path_for(video_id)
+
+    async def fill(self, video_id, url, acodec=None):
+        """Downloads a stream into the cache as Ogg/Opus, then evicts down to the size limit."""
+        if video_id in self._filling:
+            return
+        self._filling.add(video_id)
+        path = self._file_for(video_id)
+        # _filling only covers this process, a worker filling the same video writes its own file
+        tmp_path = f"{path}.{os.getpid()}.part"
+        try:
+            async with self._fill_slots:
+                codec = ['-c:a', 'copy'] if acodec == 'opus' else ['-c:a', 'libopus', '-b:a', '128k']
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+                    '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                    '-i', url, '-vn', *codec, '-f', 'ogg', tmp_path,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                )
+                if self.track_process is not None:
+                    self.track_process(process)
+                try:
+                    _, stderr = await process.communicate()
+                except asyncio.CancelledError:
+                    process.kill()
+                    raise
+            if process.returncode != 0:
+                print(f"Error caching audio for {video_id}: {stderr.decode(errors='replace').strip()}")
+                return
+            await asyncio.get_running_loop().run_in_executor(None, self._store, video_id, tmp_path, path)
+        except OSError as e:
+            print(f"Error caching audio for {video_id}: {e}")
+        finally:
+            self._filling.discard(video_id)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+
+    def _store(self, video_id, tmp_path, path):
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._db.execute("UPDATE tracks SET size = ? WHERE video_id = ?", (os.path.getsize(path), video_id))
+            self._db.commit()
+            self._evict()
+
+    def total_bytes(self):
+        if not self.enabled:
+            return 0
+        with self._lock:
+            return self._total_bytes()
+
+    def _total_bytes(self):
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM tracks").fetchone()[0]
+
+    def _evict(self):
+        """Deletes the least recently played files until the cache fits. Callers must hold self._lock."""
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT video_id, size FROM tracks WHERE size > 0 ORDER BY last_played ASC, plays ASC"
+        ).fetchall()
+        for video_id, size in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._file_for(video_id))
+            except FileNotFoundError:
+                pass
+            self._db.execute("UPDATE tracks SET size = 0 WHERE video_id = ?", (video_id,))
+            total -= size
+        self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
@@ -0,0 +1,275 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+# Where the persistent resolution cache lives. The directory is created on first use.
+CACHE_PATH = os.getenv("RESOLUTION_CACHE_PATH", os.path.join("data", "resolution_cache.sqlite3"))
+CACHE_MEMORY_SIZE = int(os.getenv("RESOLUTION_CACHE_MEMORY_SIZE", "4096"))
+# Stream URLs are signed and expire; never trust one for longer than this.
+STREAM_URL_TTL = int(os.getenv("STREAM_URL_TTL", "3600"))
+# Treat a stream URL as expired this many seconds before its real expiry.
+STREAM_URL_MARGIN = 300
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Normalizes an "artist - title" string so trivially different spellings share a key."""
+    return _SPACES.sub(" ", query.casefold()).strip()
+
+
+def stream_expiry(url, now=None):
+    """
+    Returns the unix time at which a stream URL should be considered stale.
+    googlevideo links carry their own `expire` parameter; anything else gets STREAM_URL_TTL.
+    """
+    now = now or time.time()
+    expires = now + STREAM_URL_TTL
+    try:
+        expire_param = parse_qs(urlparse(url).query).get('expire')
+        if expire_param:
+            expires = min(expires, int(expire_param[0]))
+    except (ValueError, TypeError):
+        pass
+    return expires - STREAM_URL_MARGIN
+
+
+class ResolutionCache:
+    """
+    Two-tier cache mapping song lookups to YouTube videos.
+
+    Lookups are keyed by normalized "artist - title" and, when known, by Spotify track ID.
+    Video metadata is kept indefinitely (in memory with LRU eviction and in SQLite),
+    while the short-lived stream URL is stored separately and honours its own expiry.
+
+    The SQLite file is opened in WAL mode so every cluster process can share it: a song resolved
+    in one process is a hit in the others once their in-memory tier misses. The same file holds
+    shared rate limit deadlines (see get_block/set_block).
+    """
+
+    def __init__(self, path=CACHE_PATH, memory_size=CACHE_MEMORY_SIZE):
+        self.path = path
+        self.memory_size = memory_size
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()  # lookup key -> video id (LRU)
+        self._videos = OrderedDict()  # video id -> metadata dict (LRU)
+        self._streams = {}  # video id -> (url, expires, acodec, audio formats)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS lookups (
+                key TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                web_url TEXT NOT NULL,
+                title TEXT,
+                thumbnail TEXT,
+                duration INTEGER,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS streams (
+                video_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                expires REAL NOT NULL,
+                acodec TEXT,
+                formats TEXT
+            );
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                name TEXT PRIMARY KEY,
+                blocked_until REAL NOT NULL
+            );
+        """)
+        # Caches created before the audio codec was tracked
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(streams)")]
+        if 'acodec' not in columns:
+            self._db.execute("ALTER TABLE streams ADD COLUMN acodec TEXT")
+        # ... and before the other audio formats were kept for bitrate selection
+        if 'formats' not in columns:
+            self._db.execute("ALTER TABLE streams ADD COLUMN formats TEXT")
+        self._db.commit()
+
+    @staticmethod
+    def keys_for(song_name=None, spotify_id=None):
+        keys = []
+        if spotify_id:
+            keys.append(f"sp:{spotify_id}")
+        if song_name:
+            keys.append(f"q:{normalize_query(song_name)}")
+        return keys
+
+    def get(self, song_name=None, spotify_id=None):
+        """
+        Returns a copy of the cached info for a lookup, or None on a miss.
+        The 'url' key is only present while the stream URL is still fresh; callers
+        holding a result without one can re-extract from 'web_url' and skip the search.
+        """
+        keys = self.keys_for(song_name, spotify_id)
+        with self._lock:
+            video_id = self._lookup_video_id(keys)
+            if video_id is None:
+                self.misses += 1
+                return None
+            video = self._load_video(video_id)
+            if video is None:
+                self.misses += 1
+                return None
+            info = dict(video)
+            stream = self._load_stream(video_id)
+            if stream:
+                info['url'], info['acodec'], info['formats'] = stream
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            # Make sure every alias points at the video for next time
+            for key in keys:
+                self._remember_key(key, video_id)
+            return info
+
+    def video_id_for(self, song_name=None, spotify_id=None):
+        """Returns the video a lookup resolved to, without touching the stream or the counters."""
+        with self._lock:
+            return self._lookup_video_id(self.keys_for(song_name, spotify_id))
+
+    def put(self, info, song_name=None, spotify_id=None):
+        """Stores an info dict produced by the YouTube helpers under every applicable key."""
+        video_id = info.get('id')
+        if not video_id or not info.get('web_url'):
+            return
+        keys = self.keys_for(song_name, spotify_id)
+        now = time.time()
+        video = {
+            'id': video_id,
+            'web_url': info['web_url'],
+            'name': info.get('name'),
+            'thumbnail': info.get('thumbnail'),
+            'duration': info.get('duration'),
+        }
+        with self._lock:
+            self._remember_video(video_id, video)
+            for key in keys:
+                self._remember_key(key, video_id)
+            self._db.execute(
+                "INSERT OR REPLACE INTO videos (video_id, web_url, title, thumbnail, duration, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, video['web_url'], video['name'], video['thumbnail'], video['duration'], now),
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO lookups (key, video_id) VALUES (?, ?)",
+                [(key, video_id) for key in keys],
+            )
+            if info.get('url'):
+                expires = stream_expiry(info['url'], now)
+                formats = info.get('formats') or []
+                self._streams[video_id] = (info['url'], expires, info.get('acodec'), formats)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO streams (video_id, url, expires, acodec, formats) VALUES (?, ?, ?, ?, ?)",
+                    (video_id, info['url'], expires, info.get('acodec'), json.dumps(formats, separators=(',', ':'))),
+                )
+            self._db.commit()
+
+    def get_block(self, name):
+        """Returns the unix time until which every process should hold off calling an API."""
+        with self._lock:
+            row = self._db.execute("SELECT blocked_until FROM rate_limits WHERE name = ?", (name,)).fetchone()
+            return row[0] if row else 0
+
+    def set_block(self, name, until):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO rate_limits (name, blocked_until) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                (name, until),
+            )
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.stale_hits + self.misses
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.stale_hits) / total if total else 0.0,
+                'memory_keys': len(self._keys),
+                'memory_videos': len(self._videos),
+            }
+
+    def clear_memory(self):
+        """Empties the in-memory tier; everything stays available from SQLite."""
+        with self._lock:
+            self._keys.clear()
+            self._videos.clear()
+            self._streams.clear()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # --- Internal helpers, callers must hold self._lock ---
+
+    def _lookup_video_id(self, keys):
+        for key in keys:
+            video_id = self._keys.get(key)
+            if video_id is not None:
+                self._keys.move_to_end(key)
+                return video_id
+        for key in keys:
+            row = self._db.execute("SELECT video_id FROM lookups WHERE key = ?", (key,)).fetchone()
+            if row:
+                return row[0]
+        return None
+
+    def _load_video(self, video_id):
+        video = self._videos.get(video_id)
+        if video is not None:
+            self._videos.move_to_end(video_id)
+            return video
+        row = self._db.execute(
+            "SELECT web_url, title, thumbnail, duration FROM videos WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        if not row:
+            return None
+        video = {'id': video_id, 'web_url': row[0], 'name': row[1], 'thumbnail': row[2], 'duration': row[3]}
+        self._remember_video(video_id, video)
+        return video
+
+    def _load_stream(self, video_id):
+        now = time.time()
+        entry = self._streams.get(video_id)
+        if entry is None:
+            row = self._db.execute("SELECT url, expires, acodec, formats FROM streams WHERE video_id = ?", (video_id,)).fetchone()
+            if not row:
+                return None
+            entry = (row[0], row[1], row[2], json.loads(row[3]) if row[3] else [])
+            self._streams[video_id] = entry
+        url, expires, acodec, formats = entry
+        if expires <= now:
+            del self._streams[video_id]
+            return None
+        return url, acodec, formats
+
+    def _remember_key(self, key, video_id):
+        self._keys[key] = video_id
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.memory_size:
+            self._keys.popitem(last=False)
+
+    def _remember_video(self, video_id, video):
+        self._videos[video_id] = video
+        self._videos.move_to_end(video_id)
+        while len(self._videos) > self.memory_size:
+            evicted, _ = self._videos.popitem(last=False)
+            self._streams.pop(evicted, None)
@@ -0,0 +1,242 @@
+import asyncio
+import contextlib
+import os
+import time
+from collections import deque
+
+try:
+    import psutil
+except ImportError:  # Optional, /proc is read directly on Linux
+    psutil = None
+
+# Guilds that may stream at once in this process
+FFMPEG_MAX_STREAMS = int(os.getenv("FFMPEG_MAX_STREAMS", str(max(8, (os.cpu_count() or 1) * 12))))
+# Share of all cores ffmpeg may use before new streams have to wait, 0 disables the check
+FFMPEG_MAX_CPU = float(os.getenv("FFMPEG_MAX_CPU", "0.9"))
+# Seconds a new stream waits for a free slot before it's turned down, 0 turns it down right away
+FFMPEG_ADMISSION_TIMEOUT = float(os.getenv("FFMPEG_ADMISSION_TIMEOUT", "30"))
+FFMPEG_SAMPLE_INTERVAL = float(os.getenv("FFMPEG_SAMPLE_INTERVAL", "5"))
+# ffmpeg processes not attached to a voice client for this long are killed
+FFMPEG_ORPHAN_GRACE = 15
+
+CPU_COUNT = os.cpu_count() or 1
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class StreamRejected(Exception):
+    pass
+
+
+def process_usage(pid):
+    """Returns (cpu seconds, resident bytes) of a process, or None if it can't be read."""
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            cpu = process.cpu_times()
+            return cpu.user + cpu.system, process.memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/stat", 'rb') as f:
+            # The command name may contain spaces, the fields after it don't
+            fields = f.read().rsplit(b')', 1)[1].split()
+        with open(f"/proc/{pid}/statm", 'rb') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS, resident_pages * _PAGE_SIZE
+
+
+class _Tracked:
+    __slots__ = ('process', 'guild_id', 'background', 'started', 'cpu_seconds', 'sampled_at', 'cpu_percent', 'rss')
+
+    def __init__(self, process, guild_id, background=False):
+        self.process = process
+        self.guild_id = guild_id
+        self.background = background  # Not meant to be played from, never an orphan
+        self.started = time.monotonic()
+        self.cpu_seconds = None
+        self.sampled_at = None
+        self.cpu_percent = 0.0
+        self.rss = 0
+
+    def exited(self):
+        poll = getattr(self.process, 'poll', None)  # subprocess.Popen, or an asyncio Process
+        return (poll() if poll else self.process.returncode) is not None
+
+
+class FFmpegSupervisor:
+    """
+    Accounts for every ffmpeg child of this process and limits how many guilds stream at once.
+
+    A guild takes a stream slot with admit() before its first source is created and keeps it
+    while its queue plays; release() hands it on. When every slot is taken, or the ffmpeg
+    children already use FFMPEG_MAX_CPU of the machine, new guilds wait in line for up to
+    FFMPEG_ADMISSION_TIMEOUT seconds and are then turned down with StreamRejected.
+
+    Every FFMPEG_SAMPLE_INTERVAL seconds the children's CPU and RSS are sampled (psutil if
+    installed, /proc otherwise). Children no voice client is playing from, e.g. left behind by
+    a failed play() call, are killed after FFMPEG_ORPHAN_GRACE seconds. Children that work in
+    the background, e.g. audio cache downloads, count towards the totals but are left alone.
+    """
+
+    def __init__(self, attached_pids, max_streams=FFMPEG_MAX_STREAMS, max_cpu=FFMPEG_MAX_CPU,
+                 admission_timeout=FFMPEG_ADMISSION_TIMEOUT, interval=FFMPEG_SAMPLE_INTERVAL):
+        self.attached_pids = attached_pids  # () -> pids of the processes voice clients play from
+        self.max_streams = max_streams
+        self.max_cpu = max_cpu
+        self.admission_timeout = admission_timeout
+        self.interval = interval
+        self.sessions = {}  # Guild ID -> monotonic time the slot was taken
+        self.processes = {}  # pid -> _Tracked
+        self._waiters = deque()  # (guild ID, future) in arrival order
+        self._task = None
+        self.cpu_percent = 0.0  # All children, 100 = one core
+        self.rss = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.orphans_killed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    @property
+    def saturated(self):
+        return bool(self.max_cpu) and self.cpu_percent >= self.max_cpu * CPU_COUNT * 100
+
+    def _has_room(self):
+        return len(self.sessions) < self.max_streams and not self.saturated
+
+    def must_wait(self, guild_id):
+        """True if admit() would have to put a guild in line for a slot."""
+        if guild_id in self.sessions or not self.admission_timeout:
+            return False
+        return bool(self._waiters) or not self._has_room()
+
+    async def admit(self, guild_id):
+        """Takes a stream slot for a guild, waiting in line if needed. Raises StreamRejected."""
+        if guild_id in self.sessions:
+            return
+        if not self._waiters and self._has_room():
+            self.sessions[guild_id] = time.monotonic()
+            self.admitted += 1
+            return
+
+        if not self.admission_timeout:
+            self.rejected += 1
+            raise StreamRejected(f"{len(self.sessions)} guilds are already streaming")
+
+        self.queued += 1
+        future = asyncio.get_running_loop().create_future()
+        waiter = (guild_id, future)
+        self._waiters.append(waiter)
+        try:
+            # Resolved by _admit_waiting once a slot frees up
+            await asyncio.wait_for(future, self.admission_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise StreamRejected(f"{len(self.sessions)} guilds are already streaming") from None
+        finally:
+            if not future.done() or future.cancelled():
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter) # Gave up, don't leave later guilds queued behind it
+
+    def release(self, guild_id):
+        """Gives a guild's slot to the next one in line."""
+        if self.sessions.pop(guild_id, None) is not None:
+            self._admit_waiting()
+
+    def _admit_waiting(self):
+        while self._waiters and self._has_room():
+            guild_id, future = self._waiters.popleft()
+            if future.done():
+                continue  # Gave up meanwhile
+            self.sessions[guild_id] = time.monotonic()
+            self.admitted += 1
+            future.set_result(None)
+
+    def track(self, source, guild_id):
+        """Starts accounting for the ffmpeg process behind an audio source, if it has one."""
+        process = getattr(source, '_process', None)
+        if process is not None and getattr(process, 'pid', None):
+            self.processes[process.pid] = _Tracked(process, guild_id)
+
+    def track_background(self, process):
+        """Accounts for an ffmpeg process that no voice client plays from, e.g. an audio cache fill."""
+        if getattr(process, 'pid', None):
+            self.processes[process.pid] = _Tracked(process, None, background=True)
+
+    def stats(self):
+        return {
+            'processes': len(self.processes),
+            'sessions': len(self.sessions),
+            'waiting': self.waiting,
+            'cpu_percent': round(self.cpu_percent, 1),
+            'rss': self.rss,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'orphans_killed': self.orphans_killed,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sample()
+            except Exception as e:
+                print(f"Error sampling ffmpeg processes: {e}")
+
+    async def sample(self):
+        for pid, tracked in list(self.processes.items()):
+            if tracked.exited():
+                del self.processes[pid]
+        pids = list(self.processes)
+        # Reading /proc is blocking file I/O, keep it off the event loop
+        usage = await asyncio.get_running_loop().run_in_executor(None, lambda: {pid: process_usage(pid) for pid in pids})
+
+        now = time.monotonic()
+        attached = self.attached_pids()
+        cpu_percent = rss = 0
+        for pid, tracked in list(self.processes.items()):
+            sample = usage.get(pid)
+            if sample is not None:
+                cpu_seconds, tracked.rss = sample
+                if tracked.cpu_seconds is not None and now > tracked.sampled_at:
+                    tracked.cpu_percent = (cpu_seconds - tracked.cpu_seconds) / (now - tracked.sampled_at) * 100
+                tracked.cpu_seconds, tracked.sampled_at = cpu_seconds, now
+            if not tracked.background and pid not in attached and now - tracked.started > FFMPEG_ORPHAN_GRACE:
+                print(f"Killing orphaned ffmpeg process {pid} of guild {tracked.guild_id}")
+                try:
+                    tracked.process.kill()
+                except OSError:
+                    pass
+                self.orphans_killed += 1
+                del self.processes[pid]
+                continue
+            cpu_percent += tracked.cpu_percent
+            rss += tracked.rss
+        self.cpu_percent = cpu_percent
+        self.rss = rss
+
+        # Slots of guilds that stopped streaming without releasing them (e.g. a dropped voice connection)
+        streaming = {tracked.guild_id for tracked in self.processes.values() if not tracked.background}
+        for guild_id, since in list(self.sessions.items()):
+            if guild_id not in streaming and now - since > FFMPEG_ORPHAN_GRACE:
+                del self.sessions[guild_id]
+        self._admit_waiting()
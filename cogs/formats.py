@@ -0,0 +1,55 @@
+import os
+
+# Voice channel bitrates (kbps) streams are picked for. A channel gets the smallest tier at or
+# above its bitrate; channels above the last tier get the best stream available.
+BITRATE_TIERS = (32, 48, 64, 96, 128)
+# A stream counts as good enough for a tier if its bitrate is at least this share of it
+FORMAT_BITRATE_SLACK = float(os.getenv("FORMAT_BITRATE_SLACK", "0.9"))
+
+
+def tier_for(bitrate):
+    """Maps a voice channel bitrate in bit/s to a tier in kbps, None meaning best quality."""
+    if not bitrate:
+        return None
+    kbps = bitrate / 1000
+    for tier in BITRATE_TIERS:
+        if kbps <= tier:
+            return tier
+    return None
+
+
+def audio_formats(info):
+    """
+    Returns the audio-only formats of a yt-dlp info dict as compact [url, acodec, abr] rows.
+    The info's own url is what YDL_OPTIONS picked and stays the choice for the best tier.
+    """
+    rows = []
+    seen = set()
+    for f in info.get('formats') or ():
+        if not f.get('url') or f.get('vcodec') not in (None, 'none') or f.get('acodec') in (None, 'none'):
+            continue
+        if 'drc' in (f.get('format_id') or ''):
+            continue  # Dynamic range compressed duplicates
+        acodec = 'opus' if f['acodec'].startswith('opus') else f['acodec']
+        abr = f.get('abr') or f.get('tbr')
+        if not abr or (acodec, round(abr)) in seen:
+            continue
+        seen.add((acodec, round(abr)))
+        rows.append([f['url'], acodec, round(abr)])
+    return rows
+
+
+def select_format(formats, tier):
+    """
+    Picks the smallest audio-only format good enough for a tier as (url, acodec, abr), or None to
+    keep the default stream. Opus is preferred at equal fitness since it's copied through without
+    a transcode; if nothing reaches the tier, the biggest format below it is used.
+    """
+    if tier is None or not formats:
+        return None
+    floor = tier * FORMAT_BITRATE_SLACK
+    suitable = [f for f in formats if f[2] >= floor]
+    if suitable:
+        # Smallest suitable Opus stream first, then the smallest suitable stream of any codec
+        return min(suitable, key=lambda f: (f[1] != 'opus', f[2]))
+    return max(formats, key=lambda f: (f[2], f[1] == 'opus'))
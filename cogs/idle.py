@@ -0,0 +1,73 @@
+import asyncio
+import heapq
+import os
+
+# Seconds the bot stays in a voice channel after its queue runs out
+IDLE_TIMEOUT = float(os.getenv("IDLE_TIMEOUT", "60"))
+
+
+class IdleScheduler:
+    """
+    Owns the idle-disconnect deadlines of every guild.
+
+    Deadlines sit in one heap and a single loop timer is armed for the earliest of them, so
+    idle guilds cost a heap entry each instead of a sleeping task. Rescheduling or cancelling
+    only updates the guild's current deadline; outdated heap entries are skipped when popped.
+    on_idle(guild_id) is called once a guild's deadline passes.
+    """
+
+    def __init__(self, on_idle, timeout=IDLE_TIMEOUT):
+        self.on_idle = on_idle
+        self.timeout = timeout
+        self._deadlines = {}  # Guild ID -> current deadline (loop time)
+        self._heap = []  # (deadline, guild ID), may hold outdated entries
+        self._timer = None
+        self._timer_at = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, guild_id, timeout=None):
+        """(Re)starts a guild's idle countdown."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.timeout if timeout is None else timeout)
+        self._deadlines[guild_id] = deadline
+        heapq.heappush(self._heap, (deadline, guild_id))
+        if self._timer_at is None or deadline < self._timer_at:
+            self._arm(loop, deadline)
+
+    def cancel(self, guild_id):
+        """Stops a guild's countdown, e.g. because something is playing again."""
+        self._deadlines.pop(guild_id, None)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._timer_at = None
+        self._deadlines.clear()
+        self._heap.clear()
+
+    def _arm(self, loop, deadline):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_at(deadline, self._fire)
+        self._timer_at = deadline
+
+    def _fire(self):
+        self._timer = self._timer_at = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, guild_id = heapq.heappop(self._heap)
+            if self._deadlines.get(guild_id) != deadline:
+                continue  # Cancelled or rescheduled since
+            del self._deadlines[guild_id]
+            try:
+                self.on_idle(guild_id)
+            except Exception as e:
+                print(f"Error handling idle guild {guild_id}: {e}")
+        # Outdated entries are dropped here too, so the heap doesn't grow with churn
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if self._heap:
+            self._arm(loop, self._heap[0][0])
@@ -0,0 +1,204 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+
+from aiohttp import web
+
+# Local HTTP endpoint serving the metrics below in Prometheus text format; unset disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+LOOP_LAG_INTERVAL = 0.5
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # Observations also come from resolver and audio threads
+        self._function = None
+        REGISTRY.append(self)
+
+    def set_function(self, function):
+        """
+        Computes the metric at scrape time instead. The function returns a number, or for
+        labelled metrics a dict of label value tuples to numbers.
+        """
+        self._function = function
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        if self._function is not None:
+            values = self._function()
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            values = {labels: list(state) for labels, state in self._values.items()}
+        lines = []
+        for labels, state in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', '+Inf'))} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {state[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+REGISTRY = []
+
+# Metrics live at module level so they survive !reload of the music cog
+SPOTIFY_LATENCY = Histogram('spotibot_spotify_request_seconds', 'Spotify Web API request latency.', ('endpoint',))
+SPOTIFY_RATE_LIMITED = Counter('spotibot_spotify_rate_limited_total', 'Spotify responses with status 429.')
+YTDL_LATENCY = Histogram('spotibot_ytdl_lookup_seconds', 'yt-dlp extraction latency.', ('kind',))
+RESOLVER_WAITING = Gauge('spotibot_resolver_waiting', 'Lookups waiting for a resolver slot.')
+RESOLVER_RUNNING = Gauge('spotibot_resolver_running', 'Lookups running in the resolver pool.')
+CACHE_LOOKUPS = Counter('spotibot_resolution_cache_lookups_total', 'Resolution cache lookups by result.', ('result',))
+LOOKUPS_DEDUPLICATED = Counter('spotibot_lookups_deduplicated_total', 'Lookups served without an outbound request, by reason.', ('reason',))
+NOW_PLAYING_UPDATES = Counter('spotibot_now_playing_updates_total', 'Now playing state changes by outcome (sent, coalesced, unchanged).', ('outcome',))
+FFMPEG_PROCESSES = Gauge('spotibot_ffmpeg_processes', 'Live ffmpeg subprocesses.')
+FFMPEG_CPU = Gauge('spotibot_ffmpeg_cpu_percent', 'CPU used by all ffmpeg subprocesses, 100 per core.')
+FFMPEG_RSS = Gauge('spotibot_ffmpeg_resident_bytes', 'Resident memory of all ffmpeg subprocesses.')
+STREAM_ADMISSIONS = Counter('spotibot_stream_admissions_total', 'Guilds asking for a stream slot, by outcome.', ('outcome',))
+STREAMS_OPENED = Counter('spotibot_streams_opened_total', 'Audio streams opened, by channel bitrate tier and codec picked.', ('tier', 'acodec'))
+STREAM_BITRATE = Histogram('spotibot_stream_bitrate_kbps', 'Bitrate of the audio streams picked for lower bitrate channels.',
+                           buckets=(32, 48, 64, 96, 128, 160, 256))
+SUGGESTIONS = Counter('spotibot_suggestions_total', '/play autocomplete requests by how they were answered.', ('outcome',))
+READY = Gauge('spotibot_ready', '1 once the resolver is warm after a start or reload.')
+STARTUP_SECONDS = Gauge('spotibot_startup_seconds', 'Seconds from process start to each startup phase.', ('phase',))
+# Totals rather than one series per guild, which would grow with every guild the bot ever played in
+QUEUED_TRACKS = Gauge('spotibot_queued_tracks', 'Queued tracks across all guilds.')
+ACTIVE_QUEUES = Gauge('spotibot_active_queues', 'Guilds with a track playing or queued.')
+LOOP_LAG = Gauge('spotibot_event_loop_lag_seconds', 'Most recent event loop scheduling delay.')
+LOOP_LAG_HISTOGRAM = Histogram('spotibot_event_loop_lag_histogram_seconds', 'Event loop scheduling delay.',
+                               buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+TIME_TO_AUDIO = Histogram('spotibot_time_to_first_audio_seconds', 'Time from a play command to its first audio packet.')
+
+
+def render():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class MetricsServer:
+    """Serves /metrics on METRICS_HOST:METRICS_PORT and samples event loop lag while running."""
+
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner = None
+        self._lag_task = None
+
+    async def start(self):
+        if not self.port:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._lag_task = asyncio.get_running_loop().create_task(self._sample_lag())
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+    async def _sample_lag(self):
+        while True:
+            expected = time.perf_counter() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = max(0.0, time.perf_counter() - expected)
+            LOOP_LAG.set(lag)
+            LOOP_LAG_HISTOGRAM.observe(lag)
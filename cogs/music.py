@@ -1,15 +1,34 @@
 from discord.ext import commands
+from discord import app_commands
 import discord
 import asyncio
-from yt_dlp import YoutubeDL
+import contextlib
 import functools
-import random
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import gc
 import os
 import re
-import validators
 import sys
+import threading
+import time
+from collections import deque
+
+from cogs.audio_cache import AudioCache
+from cogs.cache import ResolutionCache, normalize_query, stream_expiry
+from cogs.ffmpeg import FFmpegSupervisor, StreamRejected
+from cogs.formats import BITRATE_TIERS, FORMAT_BITRATE_SLACK, audio_formats, select_format, tier_for
+from cogs.idle import IdleScheduler
+from cogs.nowplaying import NowPlayingUpdater
+from cogs import metrics
+from cogs.player import GuildPlayer, Track
+from cogs.resolver import Resolver
+from cogs.singleflight import SingleFlight
+from cogs.snapshot import SnapshotWriter, load_snapshot
+from cogs.spotify import SpotifyClient
+from cogs.suggestions import SUGGESTION_DEBOUNCE, SuggestionCache, track_label
+from cogs.ytdl import YoutubeDLPool
+
+# Fallback start of the startup clock when the bot doesn't carry one
+IMPORTED_AT = time.monotonic()
 
 # YoutubeDL options for audio extraction
 YDL_OPTIONS = {
@@ -28,42 +47,142 @@ YDL_OPTIONS = {
     'extractor_args': {'youtube': {'player_client': ['default']}},
 }
 
+# Build the resolver's YoutubeDL instances once connected instead of on the first lookups
+YTDL_WARMUP = os.getenv("YTDL_WARMUP", "1") == "1"
+# Seconds from process start to a warm resolver that a cold start should stay within
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", "10"))
+
+# How many upcoming songs get their stream resolved ahead of playback
+PREFETCH_AHEAD = int(os.getenv("PREFETCH_AHEAD", "3"))
+
+# Spotify track links, what /play autocomplete suggestions submit
+SPOTIFY_TRACK = re.compile(r"open\.spotify\.com/(?:intl-[\w-]+/)?track/([A-Za-z0-9]+)")
+# Spotify links that expand into many tracks
+SPOTIFY_COLLECTION = re.compile(r"open\.spotify\.com/(?:intl-[\w-]+/)?(playlist|album|artist)/([A-Za-z0-9]+)")
+# Minimum seconds between edits of a playlist's progress message
+INGEST_PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "2"))
+
+# Unplayable songs named in the message about skipping them, the rest are counted
+SKIPPED_LISTED = 5
+
+# Seconds before a track ends at which the next one is opened and starts buffering, 0 disables it
+PRELOAD_SECONDS = float(os.getenv("PRELOAD_SECONDS", "5"))
+FRAMES_PER_SECOND = 50 # discord.py sends 20 ms frames
+# Seconds cleanup of an unused preloaded source waits for its buffering thread's last read
+PREBUFFER_STOP_TIMEOUT = 0.25
+
+# Songs per page of the queue view, and how long its buttons keep working
+QUEUE_PAGE_SIZE = 10
+QUEUE_VIEW_TIMEOUT = 180
+# Longer song names are cut so a full page stays well below Discord's 2000 character limit
+QUEUE_NAME_LENGTH = 80
+
 FFMPEG_OPTIONS = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
     'options': '-vn' # no video
 }
 
+class FirstPacketTimer(discord.AudioSource):
+    """Wraps an audio source to record the time from a play command to its first packet."""
+
+    def __init__(self, original, requested_at):
+        self.original = original
+        self.requested_at = requested_at
+
+    def read(self):
+        data = self.original.read()
+        if self.requested_at is not None:
+            metrics.TIME_TO_AUDIO.observe(time.perf_counter() - self.requested_at)
+            self.requested_at = None
+        return data
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def cleanup(self):
+        self.original.cleanup()
+
+class PrebufferedSource(discord.AudioSource):
+    """
+    Wraps a source opened ahead of time and reads its first frames on a helper thread, so the
+    stream is connected and buffered by the time the voice client switches over to it.
+    """
+
+    def __init__(self, original, frames):
+        self.original = original
+        self._frames = deque()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, args=(frames,), daemon=True, name="prebuffer")
+        self._thread.start()
+
+    def _fill(self, frames):
+        for _ in range(frames):
+            if self._stop.is_set():
+                return
+            data = self.original.read()
+            self._frames.append(data)
+            if not data:
+                return
+
+    def read(self):
+        if self._thread is not None:
+            # Playback starts now: stop buffering ahead and read through the buffer first
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._frames:
+            return self._frames.popleft()
+        return self.original.read()
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def cleanup(self):
+        if self._thread is not None:
+            # Let a read in progress finish before its ffmpeg process is killed underneath it
+            self._stop.set()
+            self._thread.join(PREBUFFER_STOP_TIMEOUT)
+            self._thread = None
+        self._frames.clear()
+        self.original.cleanup()
+
 class MusicControlView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
     @discord.ui.button(label="Shuffle", style=discord.ButtonStyle.success, emoji="🔀", custom_id="shuffle")
     async def shuffle(self, interaction: discord.Interaction, button: discord.ui.Button):
         music_cog = interaction.client.get_cog('Music')
-        guild_id = interaction.guild_id
+        player = music_cog.get_player(interaction.guild_id)
         
-        if not music_cog.music_queue.get(guild_id):
+        if not player.queue:
             return await interaction.response.send_message("The queue is empty.", ephemeral=True)
 
-        random.shuffle(music_cog.music_queue[guild_id])
+        player.shuffle()
         await interaction.response.send_message("🔀 Queue shuffled!", ephemeral=True)
 
     @discord.ui.button(label="Pause", style=discord.ButtonStyle.secondary, emoji="⏸️", custom_id="pause_resume")
     async def pause_resume(self, interaction: discord.Interaction, button: discord.ui.Button):
         music_cog = interaction.client.get_cog('Music')
+        player = music_cog.get_player(interaction.guild_id)
         vc = interaction.guild.voice_client
         if not vc:
             return await interaction.response.send_message("I'm not in a voice channel.", ephemeral=True)
 
         if vc.is_playing():
             vc.pause()
+            player.paused()
             button.label = "Resume"
             button.emoji = "▶️"
             await interaction.response.edit_message(view=self)
+            music_cog.now_playing(interaction.guild).shown(player.current, paused=True)
         elif vc.is_paused():
             vc.resume()
+            player.resumed()
+            music_cog._schedule_preload(interaction.guild, player)
             button.label = "Pause"
             button.emoji = "⏸️"
             await interaction.response.edit_message(view=self)
+            music_cog.now_playing(interaction.guild).shown(player.current, paused=False)
         else:
             await interaction.response.send_message("Not playing anything.", ephemeral=True)
 
@@ -79,144 +198,483 @@ class MusicControlView(discord.ui.View):
     @discord.ui.button(label="Stop", style=discord.ButtonStyle.danger, emoji="⏹️", custom_id="stop")
     async def stop(self, interaction: discord.Interaction, button: discord.ui.Button):
         music_cog = interaction.client.get_cog('Music')
-        guild_id = interaction.guild_id
+        player = music_cog.get_player(interaction.guild_id)
         vc = interaction.guild.voice_client
         if not vc:
             return await interaction.response.send_message("I'm not in a voice channel.", ephemeral=True)
 
-        if guild_id in music_cog.music_queue:
-            music_cog.music_queue[guild_id].clear()
-        
-        music_cog.is_playing[guild_id] = False
-        music_cog.current_song[guild_id] = None
+        player.stop()
+        music_cog.now_playing(interaction.guild).show_text("Playback stopped.")
 
         if vc.is_playing() or vc.is_paused():
             vc.stop()
 
-        message = music_cog.now_playing_message.get(guild_id)
-        if message:
-            try:
-                await message.edit(content="Playback stopped.", embed=None, view=None)
-            except discord.NotFound:
-                pass
-            music_cog.now_playing_message[guild_id] = None
-        
         await interaction.response.defer()
 
     @discord.ui.button(label="Queue", style=discord.ButtonStyle.secondary, emoji="📜", custom_id="queue")
     async def queue(self, interaction: discord.Interaction, button: discord.ui.Button):
         music_cog = interaction.client.get_cog('Music')
-        guild_id = interaction.guild_id
+        player = music_cog.get_player(interaction.guild_id)
         
-        if not music_cog.music_queue.get(guild_id) and not music_cog.is_playing.get(guild_id):
+        if not player.queue and not player.is_playing:
             return await interaction.response.send_message("The queue is currently empty.", ephemeral=True)
 
-        queue_list = []
-        if music_cog.is_playing.get(guild_id) and music_cog.current_song.get(guild_id):
-            queue_list.append(f"Now Playing: {music_cog.current_song[guild_id]['name']}")
-        
-        for i, song in enumerate(music_cog.music_queue.get(guild_id, [])):
-            queue_list.append(f"{i+1}. {song['name']}")
-        
-        if queue_list:
-            await interaction.response.send_message("```\n" + "\n".join(queue_list) + "\n```", ephemeral=True)
-        else:
-            await interaction.response.send_message("The queue is empty.", ephemeral=True)
+        view = QueueView(player)
+        await interaction.response.send_message(view.render(), view=view, ephemeral=True)
+        view.message = await interaction.original_response()
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+class QueueView(discord.ui.View):
+    """
+    One page of a guild's queue with buttons to flip through it. Only the visible page is read
+    from the queue, and the totals come from the player's running sums, so big queues page as
+    cheaply as small ones.
+    """
+
+    def __init__(self, player, page=0):
+        super().__init__(timeout=QUEUE_VIEW_TIMEOUT)
+        self.player = player
+        self.page = page
+        self.message = None
+
+    @property
+    def pages(self):
+        return max(1, -(-len(self.player.queue) // QUEUE_PAGE_SIZE))
+
+    def render(self):
+        player = self.player
+        self.page = min(self.page, self.pages - 1) # The queue may have shrunk since the last page
+        start = self.page * QUEUE_PAGE_SIZE
+        lines = []
+        if player.is_playing and player.current:
+            lines.append(f"Now Playing: {player.current.name[:QUEUE_NAME_LENGTH]}")
+        for i, track in enumerate(player.page(start, QUEUE_PAGE_SIZE), start + 1):
+            length = f" ({format_duration(track.duration)})" if track.duration else ""
+            lines.append(f"{i}. {track.name[:QUEUE_NAME_LENGTH]}{length}")
+        if not player.queue:
+            lines.append("Nothing else queued.")
+        lines.append("")
+        lines.append(f"Page {self.page + 1}/{self.pages} | {len(player.queue)} songs queued | {format_duration(player.remaining_seconds())} remaining")
+
+        self.previous.disabled = self.page == 0
+        self.next.disabled = self.page >= self.pages - 1
+        return "```\n" + "\n".join(lines) + "\n```"
+
+    async def _flip(self, interaction, step):
+        self.page = max(0, self.page + step)
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary, emoji="◀️")
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._flip(interaction, -1)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary, emoji="▶️")
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._flip(interaction, 1)
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass # Deleted, or an ephemeral message whose interaction expired
+
+# What a reloaded Music instance takes over from the one it replaces, next to the players
+HANDED_OVER = ('resolution_cache', 'sp', 'resolver', 'ytdl', 'audio_cache', 'ffmpeg')
 
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.music_queue = {} # Guild ID -> list of songs
-        self.is_playing = {} # Guild ID -> boolean
-        self.current_song = {} # Guild ID -> current song
-        self.now_playing_message = {} # Guild ID -> message object
+        self.players = {} # Guild ID -> GuildPlayer
+        self.now_playing_updaters = {} # Guild ID -> NowPlayingUpdater
+        self.restored = False
+        # State left behind by the instance this one replaces on !reload. Left in place until the
+        # reload finishes, so a rolled back reload hands it to the old version instead.
+        handover = getattr(bot, 'music_handover', None)
+        if handover:
+            self.players = handover['players']
+            self.restored = handover['restored']
+            # Edits still waiting for their interval go out as planned, built by this version
+            self.now_playing_updaters = handover['now_playing_updaters']
+            for guild_id, updater in self.now_playing_updaters.items():
+                updater.build_embed = functools.partial(self._now_playing_embed, guild_id=guild_id)
+                updater.build_view = MusicControlView
+            # The old instance's running lookups, stream admissions and play_next calls keep
+            # using these, so they're carried over instead of being closed and rebuilt
+            for name in HANDED_OVER:
+                setattr(self, name, handover[name])
+            self.ffmpeg.attached_pids = self._attached_ffmpeg_pids
+        else:
+            self._open_services()
+        self.audio_cache_tasks = set()
+        # Identical Spotify searches and YouTube lookups share one request, empty ones are remembered briefly
+        self.lookups = SingleFlight()
+        # Spotify search results for /play autocomplete, shared by every guild
+        self.suggestions = SuggestionCache(self._search_suggestions)
+        self.speculative_tasks = set()
+        self.speculation_timers = {} # User ID -> timer speculating on their top suggestion
+        # Disconnects from guilds whose queue ran out a while ago
+        self.idle = IdleScheduler(self._disconnect_idle)
+        # Set once the resolver is warm, see _warm_up
+        self.ready = asyncio.Event()
+        self.startup = {} # Phase -> seconds since the process started
+        self._warm_task = None
+        # Queues are written to disk periodically and restored after a restart
+        self.snapshots = SnapshotWriter(bot, self.players)
+        self.metrics_server = metrics.MetricsServer()
+        self._register_metrics()
+
+    def _open_services(self):
+        # Spotify -> YouTube resolutions, persisted across restarts and shared between clusters
+        self.resolution_cache = ResolutionCache()
         # Spotify API Setup - Client Credentials Flow (for public data like track search)
-        self.sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
+        self.sp = SpotifyClient(
             client_id=os.getenv("SPOTIPY_CLIENT_ID"),
-            client_secret=os.getenv("SPOTIPY_CLIENT_SECRET")
-        ))
-        
+            client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
+            shared_limits=self.resolution_cache
+        )
+        # Dedicated pool for yt-dlp lookups, shared fairly between guilds
+        self.resolver = Resolver()
+        self.ytdl = YoutubeDLPool(YDL_OPTIONS)
+        # Accounts for ffmpeg processes and caps how many guilds stream at once
+        self.ffmpeg = FFmpegSupervisor(self._attached_ffmpeg_pids)
+        # Local Ogg/Opus copies of frequently played tracks, downloaded by ffmpeg processes the supervisor accounts for too
+        self.audio_cache = AudioCache(track_process=self.ffmpeg.track_background)
+
+    def _register_metrics(self):
+        metrics.RESOLVER_WAITING.set_function(lambda: self.resolver.waiting)
+        metrics.RESOLVER_RUNNING.set_function(lambda: self.resolver.running)
+        metrics.CACHE_LOOKUPS.set_function(self._cache_lookup_counts)
+        metrics.LOOKUPS_DEDUPLICATED.set_function(self._deduplicated_lookup_counts)
+        metrics.FFMPEG_PROCESSES.set_function(lambda: len(self.ffmpeg.processes))
+        metrics.FFMPEG_CPU.set_function(lambda: self.ffmpeg.cpu_percent)
+        metrics.FFMPEG_RSS.set_function(lambda: self.ffmpeg.rss)
+        metrics.STREAM_ADMISSIONS.set_function(self._stream_admission_counts)
+        metrics.SUGGESTIONS.set_function(self._suggestion_counts)
+        metrics.READY.set_function(lambda: int(self.ready.is_set()))
+        metrics.STARTUP_SECONDS.set_function(lambda: {(phase,): seconds for phase, seconds in self.startup.items()})
+        metrics.QUEUED_TRACKS.set_function(lambda: sum(len(player) for player in self.players.values()))
+        metrics.ACTIVE_QUEUES.set_function(lambda: sum(1 for player in self.players.values() if player.current or player.queue))
+
+    def _cache_lookup_counts(self):
+        stats = self.resolution_cache.stats()
+        return {('hit',): stats['hits'], ('stale',): stats['stale_hits'], ('miss',): stats['misses']}
+
+    def _deduplicated_lookup_counts(self):
+        stats = self.lookups.stats()
+        return {('in_flight',): stats['coalesced'], ('negative_cache',): stats['negative_hits']}
+
+    def _suggestion_counts(self):
+        stats = self.suggestions.stats()
+        return {(outcome,): stats[outcome] for outcome in ('hits', 'prefix_hits', 'searches', 'shared_searches', 'debounced')}
+
+    def _stream_admission_counts(self):
+        stats = self.ffmpeg.stats()
+        return {(outcome,): stats[outcome] for outcome in ('admitted', 'queued', 'rejected')}
+
+    def _attached_ffmpeg_pids(self):
+        """Processes behind what the voice clients play, and behind the next songs opened ahead of time."""
+        sources = [getattr(vc, 'source', None) for vc in self.bot.voice_clients]
+        sources.extend(player.preload[1] for player in self.players.values() if player.preload)
+        pids = set()
+        for source in sources:
+            while hasattr(source, 'original'): # Unwrap FirstPacketTimer and PrebufferedSource
+                source = source.original
+            process = getattr(source, '_process', None)
+            if process is not None:
+                pids.add(process.pid)
+        return pids
+
+    def _since_start(self):
+        return time.monotonic() - getattr(self.bot, 'started_at', IMPORTED_AT)
+
+    async def cog_load(self):
+        self.startup['cog_loaded'] = self._since_start()
+        await self.metrics_server.start()
+        self.ffmpeg.start()
+        if self.bot.is_ready():
+            # Loaded into a running bot (!reload), there's no on_ready to wait for
+            self._start_warm_up()
+        if self.restored:
+            # Taken over from a reloaded instance: pick up its background work
+            self.snapshots.start()
+            for guild_id, player in self.players.items():
+                if player.queue:
+                    self._schedule_prefetch(player)
+                elif not player.is_playing:
+                    self.idle.schedule(guild_id)
+                guild = self.bot.get_guild(guild_id)
+                if guild and guild.voice_client and guild.voice_client.is_playing():
+                    self._schedule_preload(guild, player)
+
+    async def cog_unload(self):
+        # !reload: the next instance takes over the players, their playlists still loading,
+        # pending now playing edits and the services below
+        handing_over = bool(getattr(self.bot, 'music_handover', None))
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+        for task in self.speculative_tasks:
+            task.cancel()
+        for timer in self.speculation_timers.values():
+            timer.cancel()
+        for player in self.players.values():
+            if not handing_over:
+                player.cancel_ingest()
+            player.discard_preload() # Its timer calls back into this instance
+            if player.prefetch_task:
+                player.prefetch_task.cancel()
+        for task in self.audio_cache_tasks:
+            task.cancel()
+        self.idle.stop()
+        await self.snapshots.stop()
+        await self.metrics_server.stop()
+        if handing_over:
+            return
+        for updater in self.now_playing_updaters.values():
+            updater.cancel()
+        self.ffmpeg.stop()
+        self.resolver.shutdown()
+        self.resolution_cache.close()
+        self.audio_cache.close()
+        await self.sp.close()
+
+    def trim_memory(self):
+        """Drops in-memory caches and yt-dlp instances and runs a full collection. Returns objects freed."""
+        self.resolution_cache.clear_memory()
+        self.ytdl.recycle()
+        return gc.collect()
+
+    def get_player(self, guild_id):
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id)
+        return player
+
+    # Both helpers run on resolver threads and reuse that thread's YoutubeDL instance
     def _search_youtube(self, query):
-        with YoutubeDL(YDL_OPTIONS) as ydl:
-            try:
+        ydl = self.ytdl.get()
+        try:
+            with metrics.YTDL_LATENCY.time('search'):
                 info = ydl.extract_info(f"ytsearch:{query}", download=False)['entries'][0]
-                return {
-                    'url': info['url'],
-                    'web_url': info['webpage_url'],
-                    'thumbnail': info.get('thumbnail'),
-                    'duration': info.get('duration'),
-                }
-            except Exception:
-                return None
+            return {
+                'id': info.get('id'),
+                'name': info.get('title', 'Unknown Title'),
+                'url': info['url'],
+                'web_url': info['webpage_url'],
+                'thumbnail': info.get('thumbnail'),
+                'duration': info.get('duration'),
+                'acodec': info.get('acodec'),
+                'formats': audio_formats(info),
+            }
+        except Exception:
+            return None
+
     def _get_info_from_youtube_url(self, url):
-        with YoutubeDL(YDL_OPTIONS) as ydl:
-            try:
+        ydl = self.ytdl.get()
+        try:
+            with metrics.YTDL_LATENCY.time('url'):
                 info = ydl.extract_info(url, download=False)
-                return {
-                    'name': info.get('title', 'Unknown Title'),
-                    'url': info['url'],
-                    'web_url': info['webpage_url'],
-                    'thumbnail': info.get('thumbnail'),
-                    'duration': info.get('duration'),
-                }
-            except Exception:
-                return None
-
-    async def _get_song_info(self, query):
+            return {
+                'id': info.get('id'),
+                'name': info.get('title', 'Unknown Title'),
+                'url': info['url'],
+                'web_url': info['webpage_url'],
+                'thumbnail': info.get('thumbnail'),
+                'duration': info.get('duration'),
+                'acodec': info.get('acodec'),
+                'formats': audio_formats(info),
+            }
+        except Exception:
+            return None
+
+    def _resolve_song(self, song_name, spotify_id=None):
+        """
+        Resolves a Spotify song to YouTube info, going through the resolution cache.
+        A cached video whose stream URL expired is re-extracted from its page, skipping the search.
+        Blocking: run it in an executor.
+        """
+        cached = self.resolution_cache.get(song_name, spotify_id)
+        if cached and cached.get('url'):
+            return cached
+        if cached:
+            info = self._get_info_from_youtube_url(cached['web_url'])
+        else:
+            info = self._search_youtube(song_name)
+        if info:
+            self.resolution_cache.put(info, song_name, spotify_id)
+        return info
+
+    def _track_from_spotify(self, track):
+        """
+        Builds a lightweight, unresolved queue entry from a Spotify track object.
+        The YouTube stream is looked up just in time by _ensure_resolved.
+        """
+        images = (track.get('album') or {}).get('images') or []
+        return Track(
+            name=f"{track['artists'][0]['name']} - {track['name']}",
+            spotify_id=track.get('id'),
+            thumbnail=images[0]['url'] if images else None,
+            duration=track['duration_ms'] // 1000 if track.get('duration_ms') else None,
+        )
+
+    def _stream_tier(self, guild):
+        """The bitrate tier streams are picked for in a guild, from its voice channel."""
+        vc = guild.voice_client if guild else None
+        return tier_for(getattr(vc.channel, 'bitrate', None)) if vc and vc.channel else None
+
+    def _apply_stream(self, track, info, tier=None):
+        """Copies the fields of a YouTube lookup onto a track, with the stream picked for a bitrate tier."""
+        chosen = select_format(info.get('formats'), tier)
+        if chosen:
+            track.url, track.acodec, track.abr = chosen
+        else:
+            track.url, track.acodec, track.abr = info['url'], info.get('acodec'), None
+        track.url_expires = stream_expiry(info['url'])
+        track.web_url = info['web_url']
+        track.video_id = info.get('id')
+        if not track.thumbnail:
+            track.thumbnail = info.get('thumbnail')
+        if not track.duration:
+            track.duration = info.get('duration')
+
+    async def _ensure_resolved(self, track, background=False, tier=None):
+        """
+        Makes sure a queue entry has a fresh stream URL, resolving or re-resolving it if needed.
+        Concurrent callers for the same song, from any guild, share one lookup and each pick the
+        stream for their own bitrate tier. Returns False if it can't be played. Background lookups
+        (prefetching) yield worker slots to interactive ones.
+        """
+        if not track.needs_resolution:
+            return True
+
+        if track.spotify_id or not track.web_url:
+            key = ('song', track.spotify_id or normalize_query(track.name))
+            lookup = functools.partial(self._resolve_song, track.name, track.spotify_id)
+        else:  # Plain YouTube link, just re-extract it
+            key = ('url', track.web_url)
+            lookup = functools.partial(self._get_info_from_youtube_url, track.web_url)
+
+        try:
+            info = await self.lookups.run(key, self.resolver.run, lookup, background=background)
+        except Exception as e:
+            print(f"Error resolving {track.name}: {e}")
+            return False
+        if not info:
+            return False
+
+        self._apply_stream(track, info, tier)
+        return True
+
+    def _schedule_prefetch(self, player):
+        """Starts a background task resolving the next few queued songs, unless one is already running."""
+        if player.prefetch_task and not player.prefetch_task.done():
+            return
+        player.prefetch_task = self.bot.loop.create_task(self._prefetch(player))
+
+    async def _prefetch(self, player):
+        # Tracks whose lookup failed on this run. The failure may have been a network error, so
+        # they're left to the just-in-time resolve to try again rather than skipped for good.
+        failed = set()
+        # Re-check the window after every batch, the queue may have changed meanwhile
+        while True:
+            tier = self._stream_tier(self.bot.get_guild(player.guild_id))
+            pending = [
+                t for t in player.peek(PREFETCH_AHEAD)
+                if t.needs_resolution and t not in failed and not await self._cached_audio_path(t)
+            ]
+            if not pending:
+                return
+            results = await asyncio.gather(*(self._ensure_resolved(t, background=True, tier=tier) for t in pending))
+            failed.update(track for track, resolved in zip(pending, results) if not resolved)
+
+    async def _search_suggestions(self, query, limit):
+        results = await self.sp.search(q=query, type='track', limit=limit)
+        return results['tracks']['items']
+
+    def _speculate(self, track_id):
+        """
+        Starts resolving a suggested track in the background, before /play is submitted. The
+        lookup is shared with the command's own through self.lookups, or lands in the cache.
+        """
+        spotify_track = self.suggestions.track(track_id)
+        if spotify_track is None:
+            return
+        track = self._track_from_spotify(spotify_track)
+        # Not background priority: /play joins this lookup moments later and would wait on it
+        task = self.bot.loop.create_task(self._ensure_resolved(track))
+        self.speculative_tasks.add(task)
+        task.add_done_callback(self.speculative_tasks.discard)
+
+    def _speculate_when_settled(self, user_id, track_id):
+        """
+        Speculates on a user's top suggestion once they've stopped typing for SUGGESTION_DEBOUNCE
+        seconds. Discord sends nothing when a suggestion is picked, so the top one is the best guess.
+        """
+        self._cancel_speculation(user_id)
+        self.speculation_timers[user_id] = self.bot.loop.call_later(SUGGESTION_DEBOUNCE, self._settled, user_id, track_id)
+
+    def _settled(self, user_id, track_id):
+        del self.speculation_timers[user_id]
+        self._speculate(track_id)
+
+    def _cancel_speculation(self, user_id):
+        timer = self.speculation_timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    async def _search_spotify(self, query):
+        """Returns the best matching Spotify track object, or None."""
+        results = await self.sp.search(q=query, type='track', limit=1)
+        items = results['tracks']['items']
+        return items[0] if items else None
+
+    async def _get_song_info(self, query, tier=None):
         """
-        Determines the type of query and returns a list of songs and a message.
-        A song is a dictionary with 'name' and 'url'.
+        Determines the type of query and returns a list of tracks and a message.
+        Streams are picked for the given bitrate tier.
         """
         songs = []
-        loop = asyncio.get_event_loop()
         message = ""
 
+        import validators # Deferred, only needed once commands arrive
         if validators.url(query):
             if 'spotify.com' in query:
                 if 'track' in query:
                     try:
                         track_id = query.split('/')[-1].split('?')[0]
-                        track = self.sp.track(track_id)
-                        song_name = f"{track['artists'][0]['name']} - {track['name']}"
-                        yt_info = await loop.run_in_executor(None, lambda: self._search_youtube(song_name))
-                        if yt_info:
-                            songs.append({
-                                'name': song_name,
-                                'url': yt_info['url'],
-                                'web_url': yt_info['web_url'],
-                                'thumbnail': yt_info['thumbnail'],
-                                'duration': yt_info['duration'],
-                            })
-                        message = f"Added '{song_name}' to the queue."
+                        # Picked from /play autocomplete: the track object is at hand already
+                        spotify_track = self.suggestions.track(track_id) or await self.sp.track(track_id)
+                        track = self._track_from_spotify(spotify_track)
+                        if await self._ensure_resolved(track, tier=tier):
+                            songs.append(track)
+                        message = f"Added '{track.name}' to the queue."
                     except Exception as e:
                         print(f"Error processing spotify track url: {e}") # Log error
                         return None, f"Could not get Spotify track information: {e}"
             else: # Other URLs (assume YouTube)
                 try:
-                    info = await loop.run_in_executor(None, lambda: self._get_info_from_youtube_url(query))
+                    info = await self.lookups.run(('url', query), self.resolver.run, self._get_info_from_youtube_url, query)
                     if info:
-                        songs.append(info)
-                        message = f"Added '{info['name']}' to the queue."
+                        track = Track(name=info['name'])
+                        self._apply_stream(track, info, tier)
+                        songs.append(track)
+                        message = f"Added '{track.name}' to the queue."
                 except Exception as e:
                     print(f"Error processing youtube url: {e}")
                     return None, "Error processing YouTube link."
         else: # It's a search query
             try:
-                results = self.sp.search(q=query, type='track', limit=1)
-                if not results['tracks']['items']:
+                spotify_track = await self.lookups.run(('search', normalize_query(query)), self._search_spotify, query)
+                if not spotify_track:
                     return None, f"Could not find any songs matching '{query}' on Spotify."
-                track = results['tracks']['items'][0]
-                song_name = f"{track['artists'][0]['name']} - {track['name']}"
-                yt_info = await loop.run_in_executor(None, lambda: self._search_youtube(song_name))
-                if yt_info:
-                    songs.append({
-                        'name': song_name,
-                        'url': yt_info['url'],
-                        'web_url': yt_info['web_url'],
-                        'thumbnail': yt_info['thumbnail'],
-                        'duration': yt_info['duration'],
-                    })
-                    message = f"Added '{song_name}' to the queue."
+                track = self._track_from_spotify(spotify_track)
+                if await self._ensure_resolved(track, tier=tier):
+                    songs.append(track)
+                    message = f"Added '{track.name}' to the queue."
             except Exception as e:
                 print(f"Error searching spotify: {e}")
                 return None, "An error occurred while searching Spotify."
@@ -226,74 +684,322 @@ class Music(commands.Cog):
 
         return songs, message
 
-    def _create_now_playing_embed_and_view(self, song, vc):
+    def _now_playing_embed(self, track, guild_id):
         embed = discord.Embed(
             title="Now Playing",
-            description=f"[{song['name']}]({song['web_url']})" if song.get('web_url') else song['name'],
+            description=f"[{track.name}]({track.web_url})" if track.web_url else track.name,
             color=discord.Color.blue()
         )
-        if song.get('thumbnail'):
-            embed.set_thumbnail(url=song['thumbnail'])
+        if track.thumbnail:
+            embed.set_thumbnail(url=track.thumbnail)
         
-        if song.get('duration'):
-            duration = song['duration']
-            minutes, seconds = divmod(duration, 60)
-            embed.add_field(name="Duration", value=f"{minutes:02d}:{seconds:02d}", inline=True)
+        if track.duration:
+            embed.add_field(name="Duration", value=format_duration(track.duration), inline=True)
 
-        if song.get('requester'):
-            embed.set_footer(text=f"Requested by {song['requester'].display_name}", icon_url=song['requester'].avatar.url)
+        guild = self.bot.get_guild(guild_id)
+        requester = guild.get_member(track.requester_id) if guild and track.requester_id else None
+        if requester:
+            embed.set_footer(text=f"Requested by {requester.display_name}", icon_url=requester.display_avatar.url)
+        return embed
 
-        view = MusicControlView()
-        # Set button state correctly
-        if vc and vc.is_paused():
-            button = discord.utils.get(view.children, custom_id='pause_resume')
-            button.label = "Resume"
-            button.emoji = "▶️"
-        
-        return embed, view
+    def now_playing(self, guild):
+        """The guild's now playing message updater. All edits of that message go through it."""
+        updater = self.now_playing_updaters.get(guild.id)
+        if updater is None:
+            updater = self.now_playing_updaters[guild.id] = NowPlayingUpdater(
+                self.get_player(guild.id),
+                functools.partial(self._now_playing_embed, guild_id=guild.id),
+                MusicControlView,
+            )
+        return updater
 
-    # Function to play the next song in the queue
-    async def play_next(self, ctx):
-        guild_id = ctx.guild.id
-        if not self.music_queue.get(guild_id):
-            self.is_playing[guild_id] = False
-            self.current_song[guild_id] = None
-            now_playing_msg = self.now_playing_message.get(guild_id)
-            if now_playing_msg:
-                try:
-                    await now_playing_msg.edit(content="Queue finished.", embed=None, view=None)
-                except discord.NotFound:
-                    pass # Message already gone
-                self.now_playing_message[guild_id] = None
-
-            if ctx.voice_client and ctx.voice_client.is_connected():
-                await asyncio.sleep(60) # Wait a bit before disconnecting
-                if not self.is_playing.get(guild_id) and not self.music_queue.get(guild_id):
-                    await ctx.voice_client.disconnect()
+    def _show_now_playing(self, guild, channel=None):
+        player = self.get_player(guild.id)
+        vc = guild.voice_client
+        if player.current:
+            self.now_playing(guild).show_track(player.current, paused=bool(vc and vc.is_paused()), channel=channel)
+
+    async def _cached_audio_path(self, track):
+        if not self.audio_cache.enabled or not (track.video_id or track.spotify_id):
+            return None
+        # Both lookups may wait on SQLite locks held by resolver threads or other processes
+        return await self.bot.loop.run_in_executor(None, self._find_cached_audio, track)
+
+    def _find_cached_audio(self, track):
+        if not track.video_id:
+            track.video_id = self.resolution_cache.video_id_for(track.name, track.spotify_id)
+        return self.audio_cache.path_for(track.video_id)
+
+    def _start_audio_cache_task(self, coro):
+        task = self.bot.loop.create_task(coro)
+        self.audio_cache_tasks.add(task)
+        task.add_done_callback(self.audio_cache_tasks.discard)
+
+    async def _record_play(self, track):
+        """Counts a play and starts caching the track locally once it's popular enough."""
+        # Cached files serve every guild, so they aren't filled from a stream picked for a low bitrate channel
+        full_quality = not track.abr or track.abr >= BITRATE_TIERS[-1] * FORMAT_BITRATE_SLACK
+        # The index is shared with the other processes, a write may wait for their lock
+        popular = await self.bot.loop.run_in_executor(None, self.audio_cache.record_play, track.video_id)
+        if popular and track.url and full_quality:
+            self._start_audio_cache_task(self.audio_cache.fill(track.video_id, track.url, track.acodec))
+
+    def _create_source(self, track, cached_path=None, start=0):
+        seek = f"-ss {start:.1f}" if start else ""
+        if cached_path:
+            # Cached files are Ogg/Opus already, no network and no transcode
+            return discord.FFmpegOpusAudio(cached_path, codec='copy', before_options=seek or None)
+        options = dict(FFMPEG_OPTIONS)
+        if seek:
+            options['before_options'] = f"{seek} {options['before_options']}"
+        if track.acodec == 'opus':
+            # The stream is already Opus: copy packets through instead of decoding to PCM
+            # and having discord.py re-encode every frame
+            return discord.FFmpegOpusAudio(track.url, codec='copy', **options)
+        return discord.FFmpegPCMAudio(track.url, **options)
+
+    def _count_stream(self, guild, track, cached_path):
+        """Exports which stream a source was opened from."""
+        if cached_path:
+            metrics.STREAMS_OPENED.inc('cache', 'opus')
             return
+        tier = self._stream_tier(guild)
+        metrics.STREAMS_OPENED.inc(str(tier) if tier else 'best', track.acodec or 'unknown')
+        if track.abr:
+            metrics.STREAM_BITRATE.observe(track.abr)
 
-        song = self.music_queue[guild_id].pop(0)
-        self.current_song[guild_id] = song # Set the current playing song
+    def _text_channel(self, guild, player):
+        return guild.get_channel_or_thread(player.text_channel_id) if player.text_channel_id else None
 
-        embed, view = self._create_now_playing_embed_and_view(song, ctx.voice_client)
+    # Function to play the next song in the queue
+    async def play_next(self, guild, start=0, announce_wait=True):
+        player = self.get_player(guild.id)
+        skipped = []
+        await self._start_next_track(guild, player, start, skipped, announce_wait)
+        channel = self._text_channel(guild, player)
+        if skipped and channel:
+            # One message for a whole run of unplayable songs instead of one per song
+            names = ", ".join(track.name for track in skipped[:SKIPPED_LISTED])
+            more = f" and {len(skipped) - SKIPPED_LISTED} more" if len(skipped) > SKIPPED_LISTED else ""
+            await channel.send(f"Could not find a playable source for {names}{more}, skipped.")
+
+    def _still_current(self, player, track):
+        """False once the player moved on from a track while play_next was waiting, e.g. !stop."""
+        return player.current is track and player.is_playing
+
+    async def _start_next_track(self, guild, player, start, skipped, announce_wait):
+        """
+        Starts the next playable song in the queue. Songs that can't be played are added to skipped.
+        If the guild has to wait for a stream slot, that's said in its text channel unless
+        announce_wait is False, e.g. because !play already said so.
+        """
+        channel = self._text_channel(guild, player)
+        while True:
+            track = player.next()
+            if track is None:
+                player.is_playing = False
+                player.current = None
+                self.now_playing(guild).show_text("Queue finished.")
+                self.ffmpeg.release(guild.id)
+
+                if guild.voice_client and guild.voice_client.is_connected():
+                    self.idle.schedule(guild.id) # Disconnect if nothing is queued for a while
+                return
+
+            self.idle.cancel(guild.id)
+            player.current = track # Set the current playing song
+            # Opened and buffering since shortly before the previous song ended: swap it straight in
+            source = player.take_preload(track) if not start else None
+            if source is None:
+                player.discard_preload()
+                # Resolve just in time; anything further down the queue is handled by the prefetcher
+                cached_path = await self._cached_audio_path(track)
+                if not cached_path and not await self._ensure_resolved(track, tier=self._stream_tier(guild)):
+                    skipped.append(track)
+                    start = 0
+                    continue
+                if not self._still_current(player, track):
+                    return
 
-        now_playing_msg = self.now_playing_message.get(guild_id)
-        if now_playing_msg:
+            # Every start goes through admission, a preloaded source too: the guild's slot may
+            # have been reclaimed while it wasn't streaming. Instant while the guild holds one.
+            if announce_wait and channel and self.ffmpeg.must_wait(guild.id):
+                await channel.send("Queued, waiting for a stream slot...")
             try:
-                await now_playing_msg.edit(content=None, embed=embed, view=view)
-            except discord.NotFound:
-                 self.now_playing_message[guild_id] = await ctx.channel.send(content=None, embed=embed, view=view)
-        else:
-            self.now_playing_message[guild_id] = await ctx.channel.send(content=None, embed=embed, view=view)
+                await self.ffmpeg.admit(guild.id)
+            except StreamRejected as e:
+                print(f"Not starting playback in guild {guild.id}: {e}")
+                if source is not None:
+                    source.cleanup()
+                player.requeue(track)
+                player.current = None
+                player.is_playing = False
+                if channel:
+                    await channel.send("Too many servers are playing music right now, please try `!play` again in a bit.")
+                if guild.voice_client and guild.voice_client.is_connected():
+                    self.idle.schedule(guild.id) # Don't hold on to the voice connection meanwhile
+                return
+            if not self._still_current(player, track):
+                if source is not None:
+                    source.cleanup()
+                if not player.is_playing:
+                    self.ffmpeg.release(guild.id)
+                return
+            self._schedule_prefetch(player)
 
+            # Sent in the background, a burst of skips only edits the message once
+            self.now_playing(guild).show_track(track, channel=channel)
 
+            try:
+                if source is None:
+                    source = self._create_source(track, cached_path, start)
+                    self.ffmpeg.track(source, guild.id)
+                    self._count_stream(guild, track, cached_path)
+                if player.requested_at is not None:
+                    source = FirstPacketTimer(source, player.requested_at)
+                    player.requested_at = None
+                guild.voice_client.play(source, after=lambda e: self._after_track(guild))
+                player.track_started(start)
+                self._schedule_preload(guild, player)
+                self._start_audio_cache_task(self._record_play(track))
+                return
+            except Exception as e:
+                if source is not None:
+                    source.cleanup() # Don't leave its ffmpeg process behind
+                if channel:
+                    await channel.send(f"Error playing song: {track.name} - {e}")
+                if guild.voice_client is None: # Disconnected meanwhile, nothing left to play into
+                    player.is_playing = False
+                    player.current = None
+                    return
+                start = 0 # Try to play next song if error occurs
+
+    def _schedule_preload(self, guild, player):
+        """Arms a timer opening the next song's source PRELOAD_SECONDS before the current one ends."""
+        if player.preload_timer is not None:
+            player.preload_timer.cancel()
+            player.preload_timer = None
+        track = player.current
+        if PRELOAD_SECONDS <= 0 or not track or not track.duration:
+            return
+        remaining = track.duration - player.position()
+        player.preload_timer = self.bot.loop.call_later(max(0, remaining - PRELOAD_SECONDS), self._preload_due, guild, player)
+
+    def _preload_due(self, guild, player):
+        player.preload_timer = None
+        if not player.current or not player.queue or player.preload or player.paused_at is not None:
+            return
+        if player.current.duration - player.position() > PRELOAD_SECONDS + 1:
+            self._schedule_preload(guild, player) # The clock moved, e.g. a seek
+            return
+        self.bot.loop.create_task(self._preload(guild, player, player.queue[0]))
+
+    async def _preload(self, guild, player, track):
+        cached_path = await self._cached_audio_path(track)
+        if not cached_path and not await self._ensure_resolved(track, background=True, tier=self._stream_tier(guild)):
+            return
+        # The queue may have moved on while resolving
+        if player.preload or not player.queue or player.queue[0] is not track or player.paused_at is not None:
+            return
         try:
-            source = discord.FFmpegPCMAudio(song['url'], **FFMPEG_OPTIONS)
-            ctx.voice_client.play(source, after=lambda e: self.bot.loop.call_soon_threadsafe(functools.partial(asyncio.create_task, self.play_next(ctx))))
+            source = self._create_source(track, cached_path)
         except Exception as e:
-            await ctx.channel.send(f"Error playing song: {song['name']} - {e}")
-            self.is_playing[guild_id] = False
-            await self.play_next(ctx) # Try to play next song if error occurs
+            print(f"Error opening {track.name} ahead of time: {e}")
+            return
+        self.ffmpeg.track(source, guild.id)
+        self._count_stream(guild, track, cached_path)
+        player.preload = (track, PrebufferedSource(source, int(PRELOAD_SECONDS * FRAMES_PER_SECOND)))
+
+    def _disconnect_idle(self, guild_id):
+        player = self.players.get(guild_id)
+        if player and (player.is_playing or player.queue):
+            return
+        guild = self.bot.get_guild(guild_id)
+        if guild and guild.voice_client:
+            self.bot.loop.create_task(guild.voice_client.disconnect())
+
+    def _after_track(self, guild):
+        # Runs on the audio thread. The cog may have been reloaded since this track started,
+        # so hand off to whichever instance is loaded now.
+        cog = self.bot.get_cog('Music') or self
+        self.bot.loop.call_soon_threadsafe(functools.partial(asyncio.create_task, cog.play_next(guild)))
+
+    async def _restore_player(self, entry):
+        guild = self.bot.get_guild(entry['guild_id'])
+        channel = guild.get_channel(entry['voice_channel_id']) if guild else None
+        if channel is None:
+            return False
+
+        player = self.get_player(guild.id)
+        player.text_channel_id = entry['text_channel_id']
+        # Stream URLs aren't part of the snapshot, tracks resolve lazily like any other queue entry
+        player.extend(Track.from_row(row) for row in entry['queue'])
+        if entry['current']:
+            player.requeue(Track.from_row(entry['current']))
+        if not player.queue:
+            return False
+
+        if not guild.voice_client:
+            await channel.connect()
+        player.is_playing = True
+        await self.play_next(guild, start=entry['position'] if entry['current'] else 0)
+        if entry['paused'] and guild.voice_client and guild.voice_client.is_playing():
+            guild.voice_client.pause()
+            player.paused()
+        return True
+
+    async def _restore_players(self):
+        entries = load_snapshot()
+        if entries:
+            started = time.perf_counter()
+            results = await asyncio.gather(*(self._restore_player(entry) for entry in entries), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"Error restoring a guild queue: {result}")
+            restored = sum(1 for result in results if result is True)
+            print(f"Restored {restored}/{len(entries)} guild queues in {time.perf_counter() - started:.2f}s")
+        self.snapshots.start()
+
+    def _start_warm_up(self):
+        if self._warm_task is None:
+            self._warm_task = self.bot.loop.create_task(self._warm_up())
+
+    async def _warm_up(self):
+        """
+        Builds the resolver threads' YoutubeDL instances (importing yt-dlp) and fetches a Spotify
+        token. Runs once the gateway is connected, so none of it delays the bot coming online;
+        lookups arriving before it's done just do the same work on demand.
+        """
+        started = time.perf_counter()
+        jobs = []
+        if YTDL_WARMUP:
+            jobs.extend(asyncio.wrap_future(f) for f in self.ytdl.warm_up(self.resolver.executor, self.resolver.workers))
+        if self.sp.client_id:
+            jobs.append(self.sp.warm_up())
+        for result in await asyncio.gather(*jobs, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Error warming up: {result}")
+        self.ready.set()
+        if 'gateway' not in self.startup:
+            print(f"Resolver warm in {time.perf_counter() - started:.2f}s")
+            return
+        self.startup['ready'] = self._since_start()
+        print(f"Resolver warm in {time.perf_counter() - started:.2f}s, ready {self.startup['ready']:.2f}s after start")
+        if self.startup['ready'] > STARTUP_BUDGET:
+            print(f"Startup took {self.startup['ready']:.2f}s, over the {STARTUP_BUDGET:.0f}s budget: {self._startup_summary()}")
+
+    def _startup_summary(self):
+        return ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.startup.items())
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if 'gateway' not in self.startup and not self.ready.is_set():
+            self.startup['gateway'] = self._since_start()
+        self._start_warm_up()
+        # on_ready fires again after reconnects, only restore once
+        if not self.restored:
+            self.restored = True
+            await self._restore_players()
 
     @commands.command(name='join', help='Tells the bot to join the voice channel')
     async def join(self, ctx):
@@ -311,105 +1017,171 @@ class Music(commands.Cog):
             await ctx.send("I am not in a voice channel.")
             return
         
+        self.get_player(ctx.guild.id).stop()
+        self.idle.cancel(ctx.guild.id)
         await ctx.voice_client.disconnect()
         await ctx.send("Left the voice channel.")
 
     @commands.command(name='refresh', help='Kills bot process to refresh memory and creates a new one')
     async def refresh(self, ctx):
             await ctx.send("Be right back! Refreshing...")
+            await self.snapshots.flush() # Queues are picked back up on startup
             sys.exit()
             return
+
+    @commands.command(name='reload', help='Reloads the music cog in place, keeping voice connections and queues')
+    @commands.is_owner()
+    async def reload(self, ctx):
+        started = time.perf_counter()
+        # Trimmed here, the new instance takes these same caches over
+        freed = self.trim_memory()
+        # Picked up by the new instance's __init__; voice clients live on the guilds and stay connected
+        self.bot.music_handover = {
+            'players': self.players,
+            'now_playing_updaters': self.now_playing_updaters,
+            'restored': self.restored,
+        }
+        self.bot.music_handover.update((name, getattr(self, name)) for name in HANDED_OVER)
+        try:
+            await self.bot.reload_extension("cogs.music")
+        except Exception as e:
+            await ctx.send(f"Reload failed, still running the previous version: {e}")
+            return
+        finally:
+            self.bot.music_handover = None
+
+        await ctx.send(f"Reloaded the music cog in {(time.perf_counter() - started) * 1000:.0f} ms ({freed} objects freed).")
     @commands.command(name='shuffle', help='Shuffles the current queue')
     async def shuffle(self, ctx):
-        guild_id = ctx.guild.id
+        player = self.get_player(ctx.guild.id)
         
-        if not self.music_queue.get(guild_id):
+        if not player.queue:
             await ctx.send("The queue is empty, nothing to shuffle.")
             return
 
-        random.shuffle(self.music_queue[guild_id])
+        player.shuffle()
         await ctx.send("🔀 Queue shuffled!")
 
+    @commands.command(name='remove', help='Removes the song at a queue position')
+    async def remove(self, ctx, position: int):
+        player = self.get_player(ctx.guild.id)
+        if not 1 <= position <= len(player):
+            await ctx.send(f"Position must be between 1 and {len(player)}.")
+            return
+
+        track = player.remove(position - 1)
+        await ctx.send(f"Removed '{track.name}' from the queue.")
+
+    @commands.command(name='move', help='Moves a song to another queue position')
+    async def move(self, ctx, position: int, new_position: int):
+        player = self.get_player(ctx.guild.id)
+        if not (1 <= position <= len(player) and 1 <= new_position <= len(player)):
+            await ctx.send(f"Positions must be between 1 and {len(player)}.")
+            return
+
+        track = player.move(position - 1, new_position - 1)
+        await ctx.send(f"Moved '{track.name}' to position {new_position}.")
+        self._schedule_prefetch(player)
+
     @commands.command(name='player', help='Brings the music player to the bottom of the chat.')
     async def player(self, ctx):
-        guild_id = ctx.guild.id
+        player = self.get_player(ctx.guild.id)
         
-        current_song = self.current_song.get(guild_id)
-        if not current_song or not ctx.voice_client:
+        if not player.current or not ctx.voice_client:
             await ctx.send("Nothing is currently playing.")
             return
             
-        old_message = self.now_playing_message.get(guild_id)
+        old_message = player.now_playing_message
         if old_message:
             try:
                 await old_message.delete()
             except (discord.Forbidden, discord.NotFound):
                 pass
         
-        embed, view = self._create_now_playing_embed_and_view(current_song, ctx.voice_client)
-        self.now_playing_message[guild_id] = await ctx.send(embed=embed, view=view)
+        self.now_playing(ctx.guild).forget_message()
+        self._show_now_playing(ctx.guild, channel=ctx.channel)
 
-    async def handle_playlist(self, ctx, query):
-        guild_id = ctx.guild.id
-        loop = asyncio.get_event_loop()
-        
+    async def _spotify_track_pages(self, kind, spotify_id):
+        """Yields (tracks, total) for every page of a playlist, an album or an artist's top tracks as it arrives."""
+        if kind == 'playlist':
+            async with contextlib.aclosing(self.sp.playlist_pages(spotify_id)) as pages:
+                async for page in pages:
+                    yield [item.get('track') for item in page['items']], page.get('total')
+        elif kind == 'album':
+            album = await self.sp.album(spotify_id)
+            page = album['tracks']
+            while page:
+                # Album tracks come without their album, put the cover art back
+                yield [dict(track, album={'images': album.get('images')}) for track in page['items']], page.get('total')
+                page = await self.sp.next(page)
+        elif kind == 'artist':
+            tracks = (await self.sp.artist_top_tracks(spotify_id))['tracks']
+            yield tracks, len(tracks)
+
+    async def _edit_status(self, message, content):
         try:
-            playlist_id = query.split('/')[-1].split('?')[0]
-            results = self.sp.playlist_tracks(playlist_id)
-            
-            if not results['items']:
-                 await ctx.send("Playlist is empty or could not be accessed.")
-                 return
-            
-            processed_count = 0
-            
-            def get_all_tracks(results):
-                r = results
-                while r:
-                    for item in r['items']:
-                        yield item
-                    r = self.sp.next(r) if r['next'] else None
-            
-            for item in get_all_tracks(results):
-                track = item.get('track')
-                if not track:
-                    continue
+            await message.edit(content=content)
+        except discord.HTTPException:
+            pass
 
-                song_name = f"{track['artists'][0]['name']} - {track['name']}"
-                
-                yt_info = await loop.run_in_executor(None, lambda: self._search_youtube(song_name))
-                
-                if yt_info:
-                    song = {
-                        'name': song_name,
-                        'url': yt_info['url'],
-                        'web_url': yt_info['web_url'],
-                        'thumbnail': yt_info['thumbnail'],
-                        'duration': yt_info['duration'],
-                        'guild_id': guild_id,
-                        'channel_id': ctx.channel.id,
-                        'requester': ctx.author
-                    }
-                    self.music_queue[guild_id].append(song)
-                    processed_count += 1
-                    
-                    if not self.is_playing.get(guild_id):
-                        self.is_playing[guild_id] = True
-                        await self.play_next(ctx)
-            
-            await ctx.send(f"Finished adding {processed_count} songs to the queue.")
+    async def handle_playlist(self, ctx, kind, spotify_id, status):
+        """
+        Streams a Spotify playlist, album or artist into the queue page by page, starting playback
+        with the first page. Runs as the player's ingest_task, so stop, leave or another playlist
+        cancel it. Progress is shown by editing the status message.
+        """
+        player = self.get_player(ctx.guild.id)
+        added = 0
+        last_update = time.monotonic()
+        try:
+            # Only Spotify metadata is queued here, streams are resolved right before playback
+            async for spotify_tracks, total in self._spotify_track_pages(kind, spotify_id):
+                tracks = [
+                    self._track_from_spotify(t) for t in spotify_tracks
+                    if t and t.get('artists')
+                ]
+                for track in tracks:
+                    track.requester_id = ctx.author.id
+                player.extend(tracks)
+                added += len(tracks)
+
+                if not player.is_playing and player.queue:
+                    player.is_playing = True
+                    # On its own task, so the next pages keep coming in while the first song resolves
+                    self.bot.loop.create_task(self.play_next(ctx.guild))
+                else:
+                    self._schedule_prefetch(player)
 
+                if time.monotonic() - last_update >= INGEST_PROGRESS_INTERVAL:
+                    last_update = time.monotonic()
+                    await self._edit_status(status, f"Loading {kind}... {added}/{total or '?'} songs queued.")
+        except asyncio.CancelledError:
+            await self._edit_status(status, f"Stopped loading the {kind} after {added} songs.")
+            raise
         except Exception as e:
-            print(f"Error processing spotify playlist url: {e}")
-            await ctx.send(f"Could not get Spotify playlist information: {e}")
+            print(f"Error processing spotify {kind} url: {e}")
+            await self._edit_status(status, f"Could not get Spotify {kind} information: {e}")
+            return
+        finally:
+            if player.ingest_task is asyncio.current_task():
+                player.ingest_task = None
 
-    @commands.command(name='play', help='To play song')
+        if added:
+            await self._edit_status(status, f"Finished adding {added} songs to the queue.")
+        else:
+            await self._edit_status(status, f"The {kind} is empty or could not be accessed.")
+
+    @commands.hybrid_command(name='play', help='To play song')
+    @commands.guild_only()
+    @app_commands.guild_only() # Players and voice connections belong to a guild, there's no /play in DMs
+    @app_commands.describe(query="A song to search for, or a Spotify or YouTube link")
     async def play(self, ctx, *, query: str = None):
-        guild_id = ctx.guild.id
-        if guild_id not in self.music_queue:
-            self.music_queue[guild_id] = []
-            self.is_playing[guild_id] = False
-            self.current_song[guild_id] = None
+        if ctx.interaction is not None:
+            await ctx.defer() # Looking the song up can take longer than an interaction may wait
+        player = self.get_player(ctx.guild.id)
+        player.text_channel_id = ctx.channel.id
+        if not player.is_playing:
+            player.requested_at = time.perf_counter() # Measured up to the first audio packet
 
         if not ctx.author.voice:
             await ctx.send("You need to be in a voice channel to play music!")
@@ -428,30 +1200,61 @@ class Music(commands.Cog):
                 await ctx.send(f"Could not join the voice channel: {e}")
                 return
 
-        if validators.url(query) and 'spotify.com' in query and 'playlist' in query:
-            await ctx.send("Processing playlist... this might take a moment.")
-            self.bot.loop.create_task(self.handle_playlist(ctx, query))
+        collection = SPOTIFY_COLLECTION.search(query)
+        if collection:
+            kind, spotify_id = collection.groups()
+            status = await ctx.send(f"Processing {kind}... this might take a moment.")
+            player.cancel_ingest() # A new playlist takes over from one still loading
+            player.ingest_task = self.bot.loop.create_task(self.handle_playlist(ctx, kind, spotify_id, status))
             return
 
         await ctx.send("Searching...")
         
-        songs, message = await self._get_song_info(query)
+        songs, message = await self._get_song_info(query, self._stream_tier(ctx.guild))
 
         if not songs:
             await ctx.send(message)
             return
 
-        for song in songs:
-            song['guild_id'] = guild_id
-            song['channel_id'] = ctx.channel.id
-            song['requester'] = ctx.author
-            self.music_queue[guild_id].append(song)
+        for track in songs:
+            track.requester_id = ctx.author.id
+            player.add(track)
         
         await ctx.send(message)
 
-        if not self.is_playing.get(guild_id):
-            self.is_playing[guild_id] = True
-            await self.play_next(ctx)
+        if not player.is_playing:
+            player.is_playing = True
+            if self.ffmpeg.must_wait(ctx.guild.id):
+                # The wait can take FFMPEG_ADMISSION_TIMEOUT seconds, answer now and wait in the background
+                await ctx.send("Queued, waiting for a stream slot...")
+                self.bot.loop.create_task(self.play_next(ctx.guild, announce_wait=False))
+            else:
+                await self.play_next(ctx.guild)
+        else:
+            self._schedule_prefetch(player)
+
+    @play.autocomplete('query')
+    async def play_autocomplete(self, interaction: discord.Interaction, current: str):
+        if interaction.guild_id is None:
+            return []
+        self._cancel_speculation(interaction.user.id) # Still typing
+        picked = SPOTIFY_TRACK.search(current)
+        if picked:
+            # A pasted track link, e.g. of an earlier suggestion: resolve it while the command is submitted
+            self._speculate(picked.group(1))
+            track = self.suggestions.track(picked.group(1))
+            return [app_commands.Choice(name=track_label(track)[:100], value=current)] if track else []
+        try:
+            tracks = await self.suggestions.suggest(interaction.user.id, current)
+        except Exception as e:
+            print(f"Error fetching suggestions: {e}")
+            return []
+        if tracks:
+            self._speculate_when_settled(interaction.user.id, tracks[0]['id'])
+        return [
+            app_commands.Choice(name=track_label(track)[:100], value=f"https://open.spotify.com/track/{track['id']}")
+            for track in tracks
+        ]
 
     @commands.command(name='skip', help='Skips the current song')
     async def skip(self, ctx):
@@ -465,66 +1268,40 @@ class Music(commands.Cog):
 
     @commands.command(name='stop', help='Stops playback and clears the queue')
     async def stop(self, ctx):
-        guild_id = ctx.guild.id
+        player = self.get_player(ctx.guild.id)
         vc = ctx.voice_client
         if not vc:
             await ctx.send("I am not in a voice channel.")
             return
 
-        if guild_id in self.music_queue:
-            self.music_queue[guild_id].clear()
-        
-        self.is_playing[guild_id] = False
-        self.current_song[guild_id] = None
+        player.stop()
+        self.now_playing(ctx.guild).show_text("Playback stopped.")
 
         if vc.is_playing() or vc.is_paused():
             vc.stop()
-        
-        message = self.now_playing_message.get(guild_id)
-        if message:
-            try:
-                await message.edit(content="Playback stopped.", view=None)
-            except discord.NotFound:
-                pass
-            self.now_playing_message[guild_id] = None
 
         await ctx.send("Stopped playback and cleared the queue.")
 
     @commands.command(name='queue', help='Displays the current song queue')
     async def queue(self, ctx):
-        guild_id = ctx.guild.id
+        player = self.get_player(ctx.guild.id)
         
-        if not self.music_queue.get(guild_id) and not self.is_playing.get(guild_id):
+        if not player.queue and not player.is_playing:
             await ctx.send("The queue is currently empty.")
             return
 
-        queue_list = []
-        if self.is_playing.get(guild_id) and self.current_song.get(guild_id):
-            queue_list.append(f"Now Playing: {self.current_song[guild_id]['name']}")
-        
-        for i, song in enumerate(self.music_queue.get(guild_id, [])):
-            queue_list.append(f"{i+1}. {song['name']}")
-        
-        if queue_list:
-            await ctx.send("```\n" + "\n".join(queue_list) + "\n```")
-        else:
-            await ctx.send("The queue is empty.")
+        view = QueueView(player)
+        view.message = await ctx.send(view.render(), view=view)
 
     @commands.command(name='pause', help='Pauses the current song')
     async def pause(self, ctx):
         vc = ctx.voice_client
         if vc and vc.is_playing():
             vc.pause()
+            player = self.get_player(ctx.guild.id)
+            player.paused()
             await ctx.send("Playback paused.")
-            
-            message = self.now_playing_message.get(ctx.guild.id)
-            if message and message.view:
-                view = message.view
-                button = discord.utils.get(view.children, custom_id='pause_resume')
-                if button:
-                    button.label = "Resume"
-                    button.emoji = "▶️"
-                    await message.edit(view=view)
+            self._show_now_playing(ctx.guild)
         else:
             await ctx.send("No music is currently playing.")
             
@@ -533,19 +1310,49 @@ class Music(commands.Cog):
         vc = ctx.voice_client
         if vc and vc.is_paused():
             vc.resume()
+            player = self.get_player(ctx.guild.id)
+            player.resumed()
+            self._schedule_preload(ctx.guild, player)
             await ctx.send("Playback resumed.")
-
-            message = self.now_playing_message.get(ctx.guild.id)
-            if message and message.view:
-                view = message.view
-                button = discord.utils.get(view.children, custom_id='pause_resume')
-                if button:
-                    button.label = "Pause"
-                    button.emoji = "⏸️"
-                    await message.edit(view=view)
+            self._show_now_playing(ctx.guild)
         else:
             await ctx.send("No music is currently paused.")
 
+    @commands.command(name='cachestats', help='Shows song resolution cache statistics')
+    async def cachestats(self, ctx):
+        stats = self.resolution_cache.stats()
+        lookups = self.lookups.stats()
+        await ctx.send(
+            f"Resolution cache: {stats['hits']} hits, {stats['stale_hits']} stale hits, "
+            f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate).\n"
+            f"Lookups: {lookups['started']} run, {lookups['coalesced']} shared with one in flight, "
+            f"{lookups['negative_hits']} answered as not found without a retry."
+        )
+
+    @commands.command(name='sync', help='Registers the slash commands with Discord, add "here" to only update this server')
+    @commands.is_owner()
+    async def sync(self, ctx, scope: str = None):
+        # Syncing is rate limited, so it's done on request rather than on every start
+        if scope == 'here':
+            self.bot.tree.copy_global_to(guild=ctx.guild)
+            synced = await self.bot.tree.sync(guild=ctx.guild)
+        else:
+            synced = await self.bot.tree.sync()
+        await ctx.send(f"Synced {len(synced)} slash commands{' to this server' if scope == 'here' else ', they can take up to an hour to show up everywhere'}.")
+
+    @commands.command(name='status', help='Shows whether the bot is warmed up and how long startup took')
+    async def status(self, ctx):
+        state = "Ready" if self.ready.is_set() else "Warming up, first lookups may be slower"
+        lines = [f"{state}."]
+        if self.startup:
+            lines.append(f"Startup: {self._startup_summary()} (budget {STARTUP_BUDGET:.0f}s).")
+        playing = sum(1 for player in self.players.values() if player.is_playing)
+        lines.append(
+            f"Playing in {playing} servers, {len(self.ffmpeg.sessions)} streams. "
+            f"Resolver: {self.resolver.running} running, {self.resolver.waiting} waiting."
+        )
+        await ctx.send("\n".join(lines))
+
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
         if isinstance(error, commands.MissingRequiredArgument):
@@ -554,6 +1361,8 @@ class Music(commands.Cog):
             pass # Ignore unknown commands
         elif isinstance(error, commands.MissingPermissions):
             await ctx.send("You don't have the necessary permissions to use this command.")
+        elif isinstance(error, commands.NoPrivateMessage):
+            await ctx.send("Music can only be played in a server.")
         else:
             await ctx.send(f"An error occurred: {error}")
             print(f"Error in command {ctx.command}: {error}")
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+
+import discord
+
+from cogs.metrics import NOW_PLAYING_UPDATES
+
+# Minimum seconds between two edits of a guild's now playing message
+NOW_PLAYING_INTERVAL = float(os.getenv("NOW_PLAYING_INTERVAL", "2"))
+
+
+class NowPlayingUpdater:
+    """
+    Keeps one guild's now playing message in line with its player.
+
+    Callers only describe what should be shown. At most one edit goes out per interval, state
+    changes arriving in between are coalesced into it, so a burst of skips ends in a single edit
+    showing the latest track. States identical to what is already shown are dropped. The embed
+    is built once per track and a single control view is reused for every edit.
+
+    The message itself lives on the GuildPlayer (now_playing_message) so it outlives the updater.
+    """
+
+    def __init__(self, player, build_embed, build_view, interval=NOW_PLAYING_INTERVAL):
+        self.player = player
+        self.build_embed = build_embed  # track -> discord.Embed
+        self.build_view = build_view  # () -> MusicControlView
+        self.interval = interval
+        self._wanted = None  # (content, track, paused) to show
+        self._shown = None  # (content, track, paused) last sent to Discord
+        self._channel = None  # Where a new message goes if there is none to edit
+        self._task = None
+        self._last_edit = 0
+        self._embed_track = None
+        self._embed = None
+        self._view = None
+
+    def show_track(self, track, paused=False, channel=None):
+        self._request((None, track, paused), channel)
+
+    def show_text(self, content):
+        """
+        Replaces the embed with a line of text and lets the next track start a new message.
+        Ignored if the message is already being closed with another text (e.g. stop, then queue finished).
+        """
+        if self._wanted is not None and self._wanted[1] is None:
+            return
+        self._request((content, None, False), None)
+
+    def shown(self, track, paused):
+        """
+        Records a pause state an interaction response already put on the message's buttons. The
+        message may still show an earlier track; a change to this one is then still sent, in the
+        new pause state.
+        """
+        if self._shown is not None and self._shown[1] is not None:
+            self._shown = (None, self._shown[1], paused)
+        if self._wanted is not None and self._wanted[1] is track:
+            state = (None, track, paused)
+            if state == self._shown:
+                self._wanted = state
+            else:
+                self._request(state, None)
+
+    def forget_message(self):
+        """The message was deleted; the next state is sent as a new message."""
+        self.player.now_playing_message = None
+        self._shown = None
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _request(self, state, channel):
+        if self._wanted != self._shown and self._wanted != state:
+            NOW_PLAYING_UPDATES.inc('coalesced')  # The pending state never reaches Discord
+        self._wanted = state
+        if channel is not None:
+            self._channel = channel
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            delay = self._last_edit + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            state = self._wanted
+            if state == self._shown:
+                NOW_PLAYING_UPDATES.inc('unchanged')
+                return
+            try:
+                await self._apply(state)
+                NOW_PLAYING_UPDATES.inc('sent')
+            except discord.HTTPException as e:
+                print(f"Error updating now playing message: {e}")
+            self._shown = state
+            self._last_edit = time.monotonic()
+
+    def _embed_for(self, track):
+        if track is not self._embed_track:
+            self._embed_track = track
+            self._embed = self.build_embed(track)
+        return self._embed
+
+    def _view_for(self, paused):
+        if self._view is None:
+            self._view = self.build_view()
+        button = discord.utils.get(self._view.children, custom_id='pause_resume')
+        if button:
+            button.label = "Resume" if paused else "Pause"
+            button.emoji = "▶️" if paused else "⏸️"
+        return self._view
+
+    async def _apply(self, state):
+        content, track, paused = state
+        message = self.player.now_playing_message
+        if track is None:
+            if message:
+                try:
+                    await message.edit(content=content, embed=None, view=None)
+                except discord.NotFound:
+                    pass # Message already gone
+                self.player.now_playing_message = None
+            return
+
+        embed, view = self._embed_for(track), self._view_for(paused)
+        if message:
+            previous = self._shown
+            try:
+                if previous and previous[1] is track:
+                    await message.edit(view=view) # Only the pause button changed
+                else:
+                    await message.edit(content=None, embed=embed, view=view)
+                return
+            except discord.NotFound:
+                self.player.now_playing_message = None
+        if self._channel is not None:
+            self.player.now_playing_message = await self._channel.send(embed=embed, view=view)
@@ -0,0 +1,213 @@
+import random
+import time
+from collections import deque
+from itertools import islice
+
+
+class Track:
+    """
+    A queued song. Kept deliberately small: big playlists hold thousands of these per guild.
+    Stream fields (url, url_expires, acodec, abr) stay empty until the song is resolved.
+    """
+    __slots__ = (
+        'name', 'spotify_id', 'video_id', 'web_url', 'thumbnail', 'duration',
+        'url', 'url_expires', 'acodec', 'abr', 'requester_id', 'counted_seconds',
+    )
+
+    def __init__(self, name, spotify_id=None, video_id=None, web_url=None, thumbnail=None, duration=None, requester_id=None):
+        self.name = name
+        self.spotify_id = spotify_id
+        self.video_id = video_id
+        self.web_url = web_url
+        self.thumbnail = thumbnail
+        self.duration = duration
+        self.url = None
+        self.url_expires = 0
+        self.acodec = None
+        self.abr = None  # kbps of the chosen stream, if known
+        self.requester_id = requester_id
+        self.counted_seconds = 0  # Share of its player's queued_seconds, a duration learned later isn't in it
+
+    @property
+    def needs_resolution(self):
+        return not self.url or self.url_expires <= time.time()
+
+    def to_row(self):
+        """Compact, JSON-friendly form used by queue snapshots. Stream fields are left out."""
+        return [self.name, self.spotify_id, self.video_id, self.web_url, self.thumbnail, self.duration, self.requester_id]
+
+    @classmethod
+    def from_row(cls, row):
+        name, spotify_id, video_id, web_url, thumbnail, duration, requester_id = row
+        return cls(name, spotify_id, video_id, web_url, thumbnail, duration, requester_id)
+
+
+class GuildPlayer:
+    """Playback state for one guild: the queue, the current track and the now playing message."""
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.queue = deque()
+        # Running total of the queued tracks' durations, kept in step with every queue change
+        self.queued_seconds = 0
+        self.is_playing = False
+        self.current = None
+        self.now_playing_message = None
+        self.text_channel_id = None
+        self.prefetch_task = None
+        # Playlist, album or artist still being loaded into the queue
+        self.ingest_task = None
+        # (track, audio source) opened ahead of time for the next song, and the timer that opens it
+        self.preload = None
+        self.preload_timer = None
+        # Bumped on every queue or current track change, lets snapshots skip unchanged guilds
+        self.version = 0
+        # Playback clock for the current track, used to resume near the same spot after a restart
+        self.started_at = None
+        self.paused_at = None
+        # perf_counter() of the play command that started playback, until its first packet
+        self.requested_at = None
+
+    def __len__(self):
+        return len(self.queue)
+
+    def add(self, track):
+        self.queue.append(track)
+        self._enqueued(track)
+        self.version += 1
+
+    def extend(self, tracks):
+        tracks = list(tracks)
+        self.queue.extend(tracks)
+        for track in tracks:
+            self._enqueued(track)
+        self.version += 1
+
+    def requeue(self, track):
+        """Puts a track back at the front of the queue."""
+        self.queue.appendleft(track)
+        self._enqueued(track)
+        self.version += 1
+
+    def _enqueued(self, track):
+        track.counted_seconds = track.duration or 0
+        self.queued_seconds += track.counted_seconds
+
+    def _dequeued(self, track):
+        # Only what was added: the duration may have been filled in by a lookup while queued
+        self.queued_seconds -= track.counted_seconds
+        track.counted_seconds = 0
+
+    def next(self):
+        """Pops the next track off the queue, or returns None if it's empty."""
+        self.version += 1
+        if not self.queue:
+            return None
+        track = self.queue.popleft()
+        self._dequeued(track)
+        return track
+
+    def remaining_seconds(self):
+        """Playing time left in the current track and the queue."""
+        current = self.current.duration - self.position() if self.current and self.current.duration else 0
+        return max(0, current) + self.queued_seconds
+
+    def page(self, start, count):
+        """
+        Returns up to count tracks from a 0-based queue index. Each lookup still walks the deque
+        from its nearer end, 64 tracks per block in C: at most about 4 µs a page at 20k tracks.
+        """
+        return [self.queue[i] for i in range(start, min(start + count, len(self.queue)))]
+
+    def track_started(self, offset=0):
+        """Starts the playback clock for the current track, offset seconds in."""
+        self.started_at = time.time() - offset
+        self.paused_at = None
+
+    def take_preload(self, track):
+        """Returns the source opened ahead of time for a track. One opened for another track is closed."""
+        preload, self.preload = self.preload, None
+        if preload is None:
+            return None
+        if preload[0] is track:
+            return preload[1]
+        preload[1].cleanup()
+        return None
+
+    def discard_preload(self):
+        if self.preload_timer is not None:
+            self.preload_timer.cancel()
+            self.preload_timer = None
+        if self.preload is not None:
+            self.preload[1].cleanup()
+            self.preload = None
+
+    def paused(self):
+        # No point holding the next song's stream open for an unknown time
+        self.discard_preload()
+        if self.paused_at is None:
+            self.paused_at = time.time()
+
+    def resumed(self):
+        if self.paused_at is not None and self.started_at is not None:
+            self.started_at += time.time() - self.paused_at
+        self.paused_at = None
+
+    def position(self):
+        """Seconds into the current track, not counting time spent paused."""
+        if self.started_at is None:
+            return 0
+        return max(0, (self.paused_at or time.time()) - self.started_at)
+
+    def peek(self, count):
+        return list(islice(self.queue, count))
+
+    def remove(self, index):
+        """
+        Removes and returns the track at a 0-based queue index.
+
+        O(min(index, len - index)), not O(1): the deque walks to the index in C, about 6 µs in the
+        middle of a 10k queue. An indexed structure would make popleft, iteration and paging,
+        which every track goes through, slower for the sake of these occasional commands.
+        """
+        track = self.queue[index]
+        del self.queue[index]
+        self._dequeued(track)
+        self.version += 1
+        return track
+
+    def move(self, source, destination):
+        """Moves the track at one 0-based queue index to another. Same cost as remove()."""
+        track = self.remove(source)
+        self.queue.insert(destination, track)
+        self._enqueued(track)
+        self.version += 1
+        return track
+
+    def shuffle(self):
+        # Shuffling a deque in place is quadratic (indexing is O(n)), so go through a list
+        tracks = list(self.queue)
+        random.shuffle(tracks)
+        self.queue = deque(tracks)
+        self.version += 1
+
+    def clear(self):
+        self.queue.clear()
+        self.queued_seconds = 0
+        self.version += 1
+
+    def cancel_ingest(self):
+        if self.ingest_task and not self.ingest_task.done():
+            self.ingest_task.cancel()
+        self.ingest_task = None
+
+    def stop(self):
+        """Clears the queue and the current track, and stops loading any playlist into it."""
+        self.cancel_ingest()
+        self.discard_preload()
+        self.queue.clear()
+        self.queued_seconds = 0
+        self.is_playing = False
+        self.current = None
+        self.started_at = None
+        self.version += 1
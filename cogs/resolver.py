@@ -0,0 +1,54 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of threads dedicated to yt-dlp lookups, separate from the default executor
+RESOLVER_WORKERS = int(os.getenv("RESOLVER_WORKERS", str(max(2, (os.cpu_count() or 1) * 2))))
+# Worker slots that background work (prefetching queued songs) may never take, kept free for !play
+RESOLVER_RESERVED = int(os.getenv("RESOLVER_RESERVED", "1"))
+
+
+class Resolver:
+    """
+    Bounded pool running blocking song lookups off the event loop.
+
+    All lookups share one global semaphore sized to the pool. Background lookups additionally
+    go through a smaller semaphore, so a guild prefetching a huge playlist can't take every
+    worker and interactive requests from other guilds always find a free slot.
+    """
+
+    def __init__(self, workers=RESOLVER_WORKERS, reserved=RESOLVER_RESERVED):
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="resolver")
+        self._slots = asyncio.Semaphore(self.workers)
+        self._background_slots = asyncio.Semaphore(max(1, self.workers - reserved))
+        self.waiting = 0  # Lookups queued for a slot
+        self.running = 0  # Lookups currently in a worker
+
+    async def run(self, fn, *args, background=False):
+        """Runs fn(*args) in the pool and returns its result."""
+        self.waiting += 1
+        try:
+            if background:
+                await self._background_slots.acquire()
+            try:
+                await self._slots.acquire()
+            except BaseException:
+                if background:
+                    self._background_slots.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.running -= 1
+            self._slots.release()
+            if background:
+                self._background_slots.release()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
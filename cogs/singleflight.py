@@ -0,0 +1,66 @@
+import asyncio
+import functools
+import os
+import time
+from collections import OrderedDict
+
+# Seconds a lookup that found nothing is answered from memory instead of being retried
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "120"))
+NEGATIVE_CACHE_SIZE = 4096
+
+
+class SingleFlight:
+    """
+    Coalesces identical lookups. While a lookup for a key is running, other callers asking for
+    the same key await that one instead of starting their own. Lookups that come back empty are
+    remembered for negative_ttl seconds and answered with None without any outbound call.
+
+    Exceptions are passed to every waiter but not remembered, they are usually transient.
+    """
+
+    def __init__(self, negative_ttl=NEGATIVE_CACHE_TTL, negative_size=NEGATIVE_CACHE_SIZE):
+        self.negative_ttl = negative_ttl
+        self.negative_size = negative_size
+        self._in_flight = {}  # key -> task
+        self._negative = OrderedDict()  # key -> monotonic expiry
+        self.started = 0  # Lookups actually run
+        self.coalesced = 0  # Callers that joined a lookup already in flight
+        self.negative_hits = 0  # Callers answered by the negative cache
+
+    async def run(self, key, fn, *args, **kwargs):
+        """Returns the result of `await fn(*args, **kwargs)`, sharing it with identical concurrent calls."""
+        expires = self._negative.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                self.negative_hits += 1
+                return None
+            del self._negative[key]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(functools.partial(self._finished, key))
+        else:
+            self.coalesced += 1
+        # A caller giving up (e.g. a cancelled playlist) must not cancel the lookup for the others
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or task.result():
+            return
+        self._negative[key] = time.monotonic() + self.negative_ttl
+        self._negative.move_to_end(key)
+        while len(self._negative) > self.negative_size:
+            self._negative.popitem(last=False)
+
+    def stats(self):
+        return {
+            'started': self.started,
+            'coalesced': self.coalesced,
+            'negative_hits': self.negative_hits,
+            'in_flight': len(self._in_flight),
+            'negative_entries': len(self._negative),
+        }
@@ -0,0 +1,129 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", os.path.join("data", "queues.json.gz"))
+# Seconds between snapshot writes; queue changes in between are batched into one write
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "15"))
+SNAPSHOT_FORMAT = 1
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    Returns the guild entries of the last snapshot, or an empty list if there is none.
+    Only this process's own file is read; other clusters' files belong to them, even stale ones.
+    """
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable queue snapshot {path}: {e}")
+        return []
+    if data.get('format') != SNAPSHOT_FORMAT:
+        return []
+    return data.get('guilds', [])
+
+
+class SnapshotWriter:
+    """
+    Periodically writes every guild's queue to a gzipped JSON snapshot (write-behind).
+
+    Mutations only bump GuildPlayer.version; nothing is written on the hot path. Every
+    SNAPSHOT_INTERVAL seconds the writer copies the queues whose version changed, re-serializes
+    them off the event loop, reuses the cached JSON of the others, and atomically replaces the file.
+    Nothing is written while every queue is unchanged and nothing is playing.
+    """
+
+    def __init__(self, bot, players, path=SNAPSHOT_PATH, interval=SNAPSHOT_INTERVAL):
+        self.bot = bot
+        self.players = players  # Guild ID -> GuildPlayer, owned by the Music cog
+        self.path = path
+        self.interval = interval
+        self._queue_json = {}  # Guild ID -> (version, serialized queue)
+        self._last_state = None
+        self._task = None
+        self._flushing = asyncio.Lock()
+
+    def start(self):
+        # Only start once queues have been restored, or an empty snapshot could replace the last one
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stops the periodic writes, writing a last snapshot if the writer was running."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush(force=False)
+            except Exception as e:
+                print(f"Error writing queue snapshot: {e}")
+
+    def _state(self):
+        versions = tuple((guild_id, player.version) for guild_id, player in self.players.items())
+        # A playing track moves its resume position along even if the queue is untouched
+        advancing = any(player.current and player.paused_at is None for player in self.players.values())
+        return versions, advancing
+
+    def _collect(self):
+        """
+        Takes what a snapshot needs from the players, on the loop. Queues changed since their
+        last serialization are copied as they are; turning them into JSON happens off the loop.
+        """
+        entries = []
+        for guild_id, player in list(self.players.items()):
+            guild = self.bot.get_guild(guild_id)
+            vc = guild.voice_client if guild else None
+            if vc is None or not (player.current or player.queue):
+                continue
+            cached = self._queue_json.get(guild_id)
+            tracks = None if cached is not None and cached[0] == player.version else list(player.queue)
+            header = {
+                'guild_id': guild_id,
+                'voice_channel_id': vc.channel.id,
+                'text_channel_id': player.text_channel_id,
+                'current': player.current.to_row() if player.current else None,
+                'position': round(player.position(), 1),
+                'paused': player.paused_at is not None,
+            }
+            entries.append((header, player.version, tracks))
+        return entries
+
+    def _serialize(self, entries):
+        parts = []
+        for header, version, tracks in entries:
+            guild_id = header['guild_id']
+            if tracks is not None:
+                self._queue_json[guild_id] = (version, json.dumps([t.to_row() for t in tracks], separators=(',', ':')))
+            header_json = json.dumps(header, separators=(',', ':'))
+            parts.append(f"{header_json[:-1]},\"queue\":{self._queue_json[guild_id][1]}}}")
+        # Guilds that stopped playing don't need their cached JSON anymore
+        for guild_id in self._queue_json.keys() - {header['guild_id'] for header, _, _ in entries}:
+            del self._queue_json[guild_id]
+        return f"{{\"format\":{SNAPSHOT_FORMAT},\"written_at\":{time.time()},\"guilds\":[{','.join(parts)}]}}"
+
+    def _write(self, data):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=5) as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    async def flush(self, force=True):
+        """Writes a snapshot. Only copying the queues runs on the loop; JSON, compression and I/O don't."""
+        async with self._flushing:  # One at a time, they share the cached queue JSON
+            versions, advancing = self._state()
+            if not force and not advancing and versions == self._last_state:
+                return
+            self._last_state = versions
+            entries = self._collect()
+            await asyncio.get_running_loop().run_in_executor(None, lambda: self._write(self._serialize(entries)))
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+import aiohttp
+
+from cogs.metrics import SPOTIFY_LATENCY, SPOTIFY_RATE_LIMITED
+
+# Overridable so the client can be pointed at a local fake server
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+SPOTIFY_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
+MAX_CONNECTIONS = int(os.getenv("SPOTIFY_MAX_CONNECTIONS", "16"))
+MAX_RETRIES = 5
+# How often the rate limit deadline shared with other processes is re-read
+SHARED_BLOCK_REFRESH = 1.0
+PLAYLIST_PAGE_SIZE = 100
+# Playlist pages requested concurrently once the first page has told us the total
+PLAYLIST_PAGES_AHEAD = int(os.getenv("SPOTIFY_PLAYLIST_PAGES_AHEAD", "4"))
+# Country used for artist top tracks
+SPOTIFY_MARKET = os.getenv("SPOTIFY_MARKET", "US")
+
+# Only the fields the Music cog reads, keeps playlist pages small
+PLAYLIST_FIELDS = "items(track(id,name,duration_ms,artists(name),album(images))),next,total"
+
+
+class SpotifyError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"Spotify API error {status}: {message}")
+        self.status = status
+
+
+class SpotifyClient:
+    """
+    Minimal asynchronous Spotify Web API client using the Client Credentials flow.
+
+    One keep-alive HTTP session and one access token are shared by every caller. A 429 response
+    pauses all requests until its Retry-After has passed, and server errors are retried with
+    exponential backoff. Responses are the raw API JSON, same shapes as spotipy returns.
+
+    With a shared_limits store (anything with get_block/set_block, e.g. ResolutionCache), the
+    Retry-After deadline is also shared with the other cluster processes using the same app.
+    """
+
+    def __init__(self, client_id, client_secret, api_url=SPOTIFY_API_URL, token_url=SPOTIFY_TOKEN_URL, shared_limits=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = api_url.rstrip('/')
+        self.token_url = token_url
+        self._session = None
+        self._token = None
+        self._token_expires = 0
+        self._token_lock = asyncio.Lock()
+        self._blocked_until = 0  # Shared Retry-After deadline
+        self.shared_limits = shared_limits
+        self._shared_checked = 0
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=15),
+            )
+        return self._session
+
+    async def _get_token(self):
+        if self._token and time.time() < self._token_expires:
+            return self._token
+        async with self._token_lock:
+            # Another request may have refreshed it while we waited for the lock
+            if self._token and time.time() < self._token_expires:
+                return self._token
+            auth = aiohttp.BasicAuth(self.client_id or "", self.client_secret or "")
+            async with self._get_session().post(self.token_url, data={'grant_type': 'client_credentials'}, auth=auth) as resp:
+                if resp.status != 200:
+                    raise SpotifyError(resp.status, await resp.text())
+                data = await resp.json()
+            self._token = data['access_token']
+            # Refresh a minute early so in-flight requests never carry an expired token
+            self._token_expires = time.time() + data.get('expires_in', 3600) - 60
+            return self._token
+
+    async def warm_up(self):
+        """Opens the connection pool and fetches a token ahead of the first request."""
+        await self._get_token()
+
+    # The shared store is a file other processes write to as well, it's only used off the event loop
+    async def _block(self, until):
+        self._blocked_until = max(self._blocked_until, until)
+        if self.shared_limits is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.shared_limits.set_block, 'spotify', until)
+
+    async def _wait_if_blocked(self):
+        now = time.time()
+        if self.shared_limits is not None and now - self._shared_checked > SHARED_BLOCK_REFRESH:
+            self._shared_checked = now
+            shared = await asyncio.get_running_loop().run_in_executor(None, self.shared_limits.get_block, 'spotify')
+            self._blocked_until = max(self._blocked_until, shared)
+            now = time.time()
+        delay = self._blocked_until - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _get(self, url, params=None):
+        if not url.startswith("http"):
+            url = f"{self.api_url}/{url.lstrip('/')}"
+        endpoint = url[len(self.api_url):].lstrip('/').split('/')[0].split('?')[0] if url.startswith(self.api_url) else 'other'
+        backoff = 0.5
+        for attempt in range(MAX_RETRIES):
+            await self._wait_if_blocked()
+            headers = {'Authorization': f"Bearer {await self._get_token()}"}
+            started = time.perf_counter()
+            async with self._get_session().get(url, params=params, headers=headers) as resp:
+                SPOTIFY_LATENCY.observe(time.perf_counter() - started, endpoint)
+                if resp.status == 200:
+                    return await resp.json()
+                if resp.status == 429:
+                    SPOTIFY_RATE_LIMITED.inc()
+                    retry_after = float(resp.headers.get('Retry-After', backoff))
+                    await self._block(time.time() + retry_after)
+                    backoff *= 2
+                    continue
+                if resp.status == 401:
+                    self._token = None
+                    continue
+                if resp.status >= 500 and attempt < MAX_RETRIES - 1:
+                    await asyncio.sleep(backoff)
+                    backoff *= 2
+                    continue
+                raise SpotifyError(resp.status, await resp.text())
+        raise SpotifyError(429, "Too many retries")
+
+    async def track(self, track_id):
+        return await self._get(f"tracks/{track_id}")
+
+    async def search(self, q, type='track', limit=1):
+        return await self._get("search", {'q': q, 'type': type, 'limit': limit})
+
+    async def playlist_tracks(self, playlist_id, offset=0):
+        params = {'limit': PLAYLIST_PAGE_SIZE, 'offset': offset, 'fields': PLAYLIST_FIELDS}
+        return await self._get(f"playlists/{playlist_id}/tracks", params)
+
+    async def playlist_pages(self, playlist_id, ahead=PLAYLIST_PAGES_AHEAD):
+        """
+        Yields the pages of a playlist in order. The first page carries the total, after which the
+        next `ahead` pages are requested by offset concurrently instead of one 'next' link at a time.
+        Pending requests are cancelled when the caller stops iterating.
+        """
+        page = await self.playlist_tracks(playlist_id)
+        yield page
+        if page.get('total') is None:
+            # No total to compute offsets from, walk the links instead
+            while (page := await self.next(page)) is not None:
+                yield page
+            return
+
+        offsets = iter(range(PLAYLIST_PAGE_SIZE, page['total'], PLAYLIST_PAGE_SIZE))
+        pending = deque()
+        try:
+            while True:
+                while len(pending) < max(1, ahead):
+                    offset = next(offsets, None)
+                    if offset is None:
+                        break
+                    pending.append(asyncio.ensure_future(self.playlist_tracks(playlist_id, offset)))
+                if not pending:
+                    return
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def album(self, album_id):
+        """The album object, including the first page of its tracks."""
+        return await self._get(f"albums/{album_id}")
+
+    async def artist_top_tracks(self, artist_id):
+        return await self._get(f"artists/{artist_id}/top-tracks", {'market': SPOTIFY_MARKET})
+
+    async def next(self, page):
+        """Follows a paging object's 'next' link, or returns None on the last page."""
+        if not page.get('next'):
+            return None
+        return await self._get(page['next'])
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
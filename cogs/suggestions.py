@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from cogs.cache import normalize_query
+from cogs.singleflight import SingleFlight
+
+# Seconds a Spotify search result is reused for autocomplete
+SUGGESTION_TTL = float(os.getenv("SUGGESTION_TTL", "300"))
+# Seconds a user has to stop typing before their query is searched
+SUGGESTION_DEBOUNCE = float(os.getenv("SUGGESTION_DEBOUNCE", "0.3"))
+SUGGESTION_LIMIT = 10
+SUGGESTION_MIN_CHARS = 2
+SUGGESTION_CACHE_SIZE = 4096
+
+
+def track_label(track):
+    """The "artist - title" name a Spotify track is queued and suggested under."""
+    return f"{track['artists'][0]['name']} - {track['name']}"
+
+
+class SuggestionCache:
+    """
+    Spotify track suggestions for autocomplete, shared by every guild.
+
+    Autocomplete fires on every keystroke. A query is only searched once its user has stopped
+    typing for `debounce` seconds; the keystrokes in between are answered from the cache or not
+    at all. Results are kept for `ttl` seconds by normalized query, and a result list shorter
+    than the limit is complete, so longer queries starting with it are answered by filtering it.
+    The track objects behind the suggestions are kept too, a picked suggestion needs no lookup.
+    """
+
+    def __init__(self, search, ttl=SUGGESTION_TTL, debounce=SUGGESTION_DEBOUNCE, limit=SUGGESTION_LIMIT, size=SUGGESTION_CACHE_SIZE):
+        self.search = search  # async (query, limit) -> list of Spotify track objects
+        self.ttl = ttl
+        self.debounce = debounce
+        self.limit = limit
+        self.size = size
+        self._results = OrderedDict()  # normalized query -> (monotonic expiry, track IDs)
+        self._tracks = OrderedDict()  # Spotify track ID -> track object
+        self._latest = {}  # User ID -> query they typed last, while debouncing
+        self._searches = SingleFlight(negative_ttl=0)
+        self.hits = 0
+        self.prefix_hits = 0
+        self.debounced = 0
+
+    def track(self, track_id):
+        """The track object of a suggestion that was shown, or None."""
+        track = self._tracks.get(track_id)
+        if track is not None:
+            self._tracks.move_to_end(track_id)
+        return track
+
+    async def suggest(self, user_id, query):
+        """Returns the Spotify tracks to suggest for what a user has typed so far."""
+        key = normalize_query(query)
+        if len(key) < SUGGESTION_MIN_CHARS:
+            return []
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        self._latest[user_id] = key
+        await asyncio.sleep(self.debounce)
+        if self._latest.get(user_id) != key:
+            self.debounced += 1  # Typed on meanwhile, that request does the search
+            return []
+        del self._latest[user_id]
+
+        # Users of other guilds typing the same thing share the search
+        tracks = await self._searches.run(key, self.search, key, self.limit)
+        self._store(key, tracks)
+        return tracks
+
+    def _cached(self, key):
+        now = time.monotonic()
+        entry = self._results.get(key)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._lookup(entry[1])
+        # The longest complete result for a prefix of the query, narrowed down to it
+        words = key.split()
+        for end in range(len(key) - 1, SUGGESTION_MIN_CHARS - 1, -1):
+            entry = self._results.get(key[:end])
+            if entry is None or entry[0] <= now or len(entry[1]) >= self.limit:
+                continue
+            tracks = self._lookup(entry[1])
+            if tracks is None:
+                return None
+            matches = [t for t in tracks if all(word in normalize_query(track_label(t)) for word in words)]
+            if not matches:
+                return None  # Spotify matches more loosely than this, ask it
+            self.prefix_hits += 1
+            return matches
+        return None
+
+    def _lookup(self, track_ids):
+        tracks = [self._tracks.get(track_id) for track_id in track_ids]
+        return None if None in tracks else tracks
+
+    def _store(self, key, tracks):
+        tracks = [t for t in tracks if t and t.get('id')]
+        self._results[key] = (time.monotonic() + self.ttl, [t['id'] for t in tracks])
+        self._results.move_to_end(key)
+        while len(self._results) > self.size:
+            self._results.popitem(last=False)
+        for track in tracks:
+            self._tracks[track['id']] = track
+            self._tracks.move_to_end(track['id'])
+        while len(self._tracks) > self.size * 2:
+            self._tracks.popitem(last=False)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'prefix_hits': self.prefix_hits,
+            'searches': self._searches.started,
+            'shared_searches': self._searches.coalesced,
+            'debounced': self.debounced,
+        }
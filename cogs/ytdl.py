@@ -0,0 +1,65 @@
+import os
+import threading
+
+# Rebuild a thread's YoutubeDL after this many lookups to bound memory growth
+YTDL_RECYCLE_AFTER = int(os.getenv("YTDL_RECYCLE_AFTER", "200"))
+# Extractors every lookup needs; loading them up front takes the cost off the first !play
+WARM_EXTRACTORS = ('Youtube', 'YoutubeSearch')
+
+
+class YoutubeDLPool:
+    """
+    Hands out one long-lived YoutubeDL instance per worker thread.
+
+    YoutubeDL isn't thread-safe, so instances are thread-confined rather than shared. Each is
+    reused across lookups, keeping its loaded extractors and HTTP connections, and is replaced
+    after YTDL_RECYCLE_AFTER uses or whenever recycle() is called.
+    """
+
+    def __init__(self, options, recycle_after=YTDL_RECYCLE_AFTER):
+        self.options = options
+        self.recycle_after = recycle_after
+        self.generation = 0
+        self.created = 0
+        self._local = threading.local()
+
+    def get(self):
+        """Returns the calling thread's YoutubeDL instance, creating or recycling it as needed."""
+        local = self._local
+        ydl = getattr(local, 'ydl', None)
+        if ydl is not None and (local.uses >= self.recycle_after or local.generation != self.generation):
+            ydl.close()
+            ydl = None
+        if ydl is None:
+            # yt-dlp is a large package; importing it here keeps it off the bot's startup path
+            from yt_dlp import YoutubeDL
+            ydl = YoutubeDL(self.options)
+            for name in WARM_EXTRACTORS:
+                ydl.get_info_extractor(name)
+            local.ydl = ydl
+            local.uses = 0
+            local.generation = self.generation
+            self.created += 1
+        local.uses += 1
+        return ydl
+
+    def recycle(self):
+        """Makes every thread build a fresh instance on its next lookup."""
+        self.generation += 1
+
+    def warm_up(self, executor, workers):
+        """
+        Builds an instance on each of the executor's worker threads.
+        A barrier keeps each warm-up task on its own thread until all of them have started.
+        """
+        barrier = threading.Barrier(workers)
+
+        def warm():
+            self.get()
+            try:
+                barrier.wait(timeout=30)
+            except threading.BrokenBarrierError:
+                pass
+            self._local.uses -= 1  # Warming up isn't a real lookup
+
+        return [executor.submit(warm) for _ in range(workers)]
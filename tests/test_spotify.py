@@ -0,0 +1,146 @@
+import asyncio
+import time
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from cogs.spotify import SpotifyClient, SpotifyError
+
+
+class SharedLimits:
+    """Stands in for ResolutionCache's rate limit store."""
+
+    def __init__(self):
+        self.blocks = {}
+
+    def get_block(self, name):
+        return self.blocks.get(name, 0)
+
+    def set_block(self, name, until):
+        self.blocks[name] = max(self.blocks.get(name, 0), until)
+
+
+class FakeSpotifyServer:
+    """
+    A local Spotify Web API answering /token and /v1/tracks/<id>. Each test queues the statuses
+    the next track requests get; once the queue is empty every request succeeds.
+    """
+
+    def __init__(self):
+        self.token_requests = 0
+        self.track_requests = 0
+        self.statuses = []  # (status, headers) for the next track requests
+        self.tokens_seen = []
+        app = web.Application()
+        app.router.add_post('/token', self.token)
+        app.router.add_get('/v1/tracks/{track_id}', self.track)
+        self.server = TestServer(app)
+
+    async def __aenter__(self):
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.server.close()
+
+    def client(self, **kwargs):
+        return SpotifyClient(
+            client_id='id', client_secret='secret',
+            api_url=str(self.server.make_url('/v1')), token_url=str(self.server.make_url('/token')),
+            **kwargs,
+        )
+
+    async def token(self, request):
+        self.token_requests += 1
+        await asyncio.sleep(0.05)  # Long enough for concurrent requests to pile up on the lock
+        return web.json_response({'access_token': f'token-{self.token_requests}', 'expires_in': 3600})
+
+    async def track(self, request):
+        self.track_requests += 1
+        self.tokens_seen.append(request.headers.get('Authorization'))
+        if self.statuses:
+            status, headers = self.statuses.pop(0)
+            return web.Response(status=status, headers=headers, text='error')
+        return web.json_response({'id': request.match_info['track_id']})
+
+
+class SpotifyClientTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_share_one_token(self):
+        async with FakeSpotifyServer() as server:
+            client = server.client()
+            try:
+                tracks = await asyncio.gather(*(client.track(f'id{i}') for i in range(10)))
+            finally:
+                await client.close()
+        self.assertEqual([track['id'] for track in tracks], [f'id{i}' for i in range(10)])
+        self.assertEqual(server.token_requests, 1)
+        self.assertEqual(set(server.tokens_seen), {'Bearer token-1'})
+
+    async def test_rate_limit_waits_for_retry_after_and_shares_it(self):
+        limits = SharedLimits()
+        async with FakeSpotifyServer() as server:
+            server.statuses = [(429, {'Retry-After': '0.3'})]
+            client = server.client(shared_limits=limits)
+            try:
+                started = time.monotonic()
+                track = await client.track('id1')
+                elapsed = time.monotonic() - started
+            finally:
+                await client.close()
+        self.assertEqual(track['id'], 'id1')
+        self.assertEqual(server.track_requests, 2)
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertGreater(limits.get_block('spotify'), 0)
+
+    async def test_block_from_another_process_is_honoured(self):
+        limits = SharedLimits()
+        limits.set_block('spotify', time.time() + 0.3)
+        async with FakeSpotifyServer() as server:
+            client = server.client(shared_limits=limits)
+            try:
+                started = time.monotonic()
+                await client.track('id1')
+                elapsed = time.monotonic() - started
+            finally:
+                await client.close()
+        self.assertGreaterEqual(elapsed, 0.25)
+
+    async def test_expired_token_is_refreshed(self):
+        async with FakeSpotifyServer() as server:
+            server.statuses = [(401, {})]
+            client = server.client()
+            try:
+                track = await client.track('id1')
+            finally:
+                await client.close()
+        self.assertEqual(track['id'], 'id1')
+        self.assertEqual(server.token_requests, 2)
+        self.assertEqual(server.tokens_seen, ['Bearer token-1', 'Bearer token-2'])
+
+    async def test_server_errors_are_retried(self):
+        async with FakeSpotifyServer() as server:
+            server.statuses = [(503, {}), (500, {})]
+            client = server.client()
+            try:
+                track = await client.track('id1')
+            finally:
+                await client.close()
+        self.assertEqual(track['id'], 'id1')
+        self.assertEqual(server.track_requests, 3)
+
+    async def test_client_errors_are_raised(self):
+        async with FakeSpotifyServer() as server:
+            server.statuses = [(404, {})]
+            client = server.client()
+            try:
+                with self.assertRaises(SpotifyError) as raised:
+                    await client.track('missing')
+            finally:
+                await client.close()
+        self.assertEqual(raised.exception.status, 404)
+        self.assertEqual(server.track_requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()